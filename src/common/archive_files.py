@@ -0,0 +1,51 @@
+"""Parquet year files of the archived fund history, ARCHIVE_DIR/document=<doc>/year=<YYYY>.parquet.
+
+Shared by the archive job and the workers (queue) and the API, which all merge late quotes into them.
+"""
+import fcntl
+import os
+from datetime import datetime
+from typing import Dict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.int64()),
+    ("value", pa.float64()),
+    ("owners", pa.int64()),
+    ("net_worth", pa.float64()),
+])
+# about a month of business days, readers only decompress the row groups of the window they ask for
+ROW_GROUP_ROWS = 32
+
+
+def year_path(root: str, document: str, year: int) -> str:
+    return os.path.join(root, f"document={document}", f"year={year}.parquet")
+
+
+def merge_year(path: str, rows: Dict[int, dict]):
+    """Write `rows` (timestamp -> columns) into a year file, over the rows it already holds."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # the archive job, the workers and the API may merge into the same file
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(path):
+            existing = pq.read_table(path, memory_map=True).to_pylist()
+            rows = {**{row["timestamp"]: row for row in existing}, **rows}
+        ordered = [rows[timestamp] for timestamp in sorted(rows)]
+        table = pa.Table.from_pylist(ordered, schema=SCHEMA)
+        # readers memory-map the files, never rewrite one in place
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd", row_group_size=ROW_GROUP_ROWS)
+        os.replace(tmp_path, path)
+
+
+def merge_rows(root: str, document: str, rows: Dict[int, dict]) -> int:
+    """Merge `rows` (timestamp -> columns) into the year files of a fund, returns the number of year files."""
+    by_year: Dict[int, Dict[int, dict]] = {}
+    for timestamp, row in rows.items():
+        by_year.setdefault(datetime.fromtimestamp(timestamp).year, {})[timestamp] = row
+    for year, year_rows in by_year.items():
+        merge_year(year_path(root, document, year), year_rows)
+    return len(by_year)
@@ -0,0 +1,58 @@
+"""Parsing of the CVM ASP.NET pages replayed by the HTTP engine, shared by the API and the queue workers."""
+import html
+import re
+from typing import Dict, List, Tuple, Union
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0 Safari/537.36",
+}
+MONTH_SELECTOR = "ddComptc"
+
+INPUT_RE = re.compile(r"<input\b[^>]*>", re.IGNORECASE)
+ANCHOR_RE = re.compile(r"<a\b[^>]*>", re.IGNORECASE)
+ATTR_RE = re.compile(r'([\w:$-]+)\s*=\s*"([^"]*)"')
+SELECT_RE = re.compile(rf'<select\b[^>]*id="{MONTH_SELECTOR}"[^>]*>(.*?)</select>', re.IGNORECASE | re.DOTALL)
+OPTION_RE = re.compile(r"<option\b([^>]*)>(.*?)</option>", re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def clean_text(raw: str) -> str:
+    text = html.unescape(TAG_RE.sub("", raw))
+    return text.replace("\xa0", " ").strip()
+
+
+def hidden_fields(page: str) -> Dict[str, str]:
+    """ASP.NET state (__VIEWSTATE, __EVENTVALIDATION, ...) that must be replayed on every postback."""
+    fields = {}
+    for tag in INPUT_RE.findall(page):
+        attrs = dict(ATTR_RE.findall(tag))
+        if attrs.get("type", "").lower() == "hidden" and "name" in attrs:
+            fields[attrs["name"]] = html.unescape(attrs.get("value", ""))
+    return fields
+
+
+def span_text(page: str, element_id: str) -> str:
+    match = re.search(rf'<span\b[^>]*id="{element_id}"[^>]*>(.*?)</span>', page, re.IGNORECASE | re.DOTALL)
+    return clean_text(match.group(1)) if match else ""
+
+
+def anchor_href(page: str, element_id: str) -> Union[str, None]:
+    for tag in ANCHOR_RE.findall(page):
+        attrs = dict(ATTR_RE.findall(tag))
+        if attrs.get("id") == element_id:
+            return html.unescape(attrs.get("href", "")) or None
+    return None
+
+
+def month_options(page: str) -> List[Tuple[str, str, bool]]:
+    """(option value, month_year, selected) of the ddComptc selector, in page order."""
+    select = SELECT_RE.search(page)
+    if select is None:
+        return []
+    options = []
+    for attrs, text in OPTION_RE.findall(select.group(1)):
+        month_year = clean_text(text).replace(" ", "")
+        value = dict(ATTR_RE.findall(attrs)).get("value", month_year)
+        if month_year:
+            options.append((html.unescape(value), month_year, "selected" in attrs.lower()))
+    return options
@@ -0,0 +1,203 @@
+"""RedisTimeSeries writer shared by the API and the queue workers.
+
+Kept once in src/common and copied next to each service's modules by its Dockerfile, so it imports no
+service settings: callers pass MADD_BATCH_SIZE as `chunk_size`.
+"""
+import logging
+from decimal import Decimal
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import aioredis as redis
+
+logger = logging.getLogger("pricerlog")
+
+Sample = Tuple[str, int, object]
+KEY_PREFIX = "PRICER_"
+DEFAULT_CHUNK_SIZE = 1000
+
+# sample timestamps are in seconds, buckets are fixed length and aligned on the epoch
+WEEK = 7 * 24 * 3600
+MONTH = 30 * 24 * 3600
+# metric -> (resolution, aggregation, bucket) of the companion series fed by TS.CREATERULE
+COMPACTIONS = {
+    "value": (("1w", "last", WEEK), ("1m", "last", MONTH), ("1m", "min", MONTH), ("1m", "max", MONTH)),
+    "networth": (("1m", "avg", MONTH),),
+}
+
+
+def compacted_key(key: str, resolution: str, aggregation: str) -> str:
+    return f"{key}_{resolution}_{aggregation}"
+
+
+def compactions(key: str) -> Tuple[Tuple[str, str, int], ...]:
+    labels = series_labels(key)
+    if "resolution" in labels:
+        return ()
+    return COMPACTIONS.get(labels["metric"], ())
+
+
+def series_labels(key: str, fund_pk: Optional[str] = None) -> Dict[str, str]:
+    """Labels of a PRICER_<metric>_<document>[_<resolution>_<aggregation>] series, used by TS.MRANGE filters.
+
+    Only compacted series carry resolution/aggregation, `resolution=` filters the daily ones.
+    """
+    metric, _, rest = key[len(KEY_PREFIX):].partition("_")
+    document, _, compaction = rest.partition("_")
+    labels = {"document": document, "metric": metric}
+    if compaction:
+        resolution, _, aggregation = compaction.partition("_")
+        labels.update(resolution=resolution, aggregation=aggregation)
+    if fund_pk:
+        labels["fund_pk"] = str(fund_pk)
+    return labels
+
+
+def labels_args(labels: Dict[str, str]) -> List[str]:
+    args = ["LABELS"]
+    for name, value in labels.items():
+        args.extend((name, value))
+    return args
+
+
+class TimeSeriesWriter:
+    """Write samples to RedisTimeSeries with bounded TS.MADD commands sent through a single pipeline.
+
+    Series already created are remembered in `created`, so EXISTS/TS.CREATE run once per key. Pass the same
+    set to writers made per request to share it, e.g. for the lifetime of the API process.
+    Series are labeled with document, metric and fund_pk, existing ones get their labels on first write.
+    New value and net worth series get their compacted companions, see `COMPACTIONS`.
+    """
+
+    def __init__(
+            self,
+            redis_client: redis.Redis,
+            duplicate_policy: str = "last",
+            chunk_size: int = None,
+            created: Set[str] = None
+    ):
+        self.logger = logger
+        self.redis = redis_client
+        self.duplicate_policy = duplicate_policy
+        self.chunk_size = chunk_size if chunk_size is not None else DEFAULT_CHUNK_SIZE
+        self.created = created if created is not None else set()
+        # key -> fund_pk label, series created again by `write` keep it
+        self.fund_pks: Dict[str, str] = {}
+        self.written = 0
+        self.elapsed = 0.0
+
+    async def ensure_series(self, keys: Iterable[str], fund_pk: Optional[str] = None):
+        await self.ensure_many(dict.fromkeys(keys, fund_pk))
+
+    async def ensure_many(self, fund_pks: Dict[str, Optional[str]]):
+        """`ensure_series` of the keys of several funds (key -> fund_pk) in the same two pipelined round trips."""
+        self.fund_pks.update({key: str(fund_pk) for key, fund_pk in fund_pks.items() if fund_pk})
+        missing = [key for key in fund_pks if key not in self.created]
+        if not missing:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for key in missing:
+            pipe.exists(key)
+        existing = await pipe.execute()
+        pipe = self.redis.pipeline(transaction=False)
+        commands = []
+        for key, exists in zip(missing, existing):
+            fund_pk = fund_pks[key]
+            labels = labels_args(series_labels(key, fund_pk))
+            if not exists:
+                self.logger.info(f"Key {key} not found, will be created!")
+                pipe.execute_command('TS.CREATE', key, 'DUPLICATE_POLICY', self.duplicate_policy, *labels)
+                commands.append(key)
+                for resolution, aggregation, bucket in compactions(key):
+                    destination = compacted_key(key, resolution, aggregation)
+                    pipe.execute_command(
+                        'TS.CREATE', destination, 'DUPLICATE_POLICY', 'last',
+                        *labels_args(series_labels(destination, fund_pk))
+                    )
+                    pipe.execute_command('TS.CREATERULE', key, destination, 'AGGREGATION', aggregation, bucket)
+                    commands.extend((destination, destination))
+            elif fund_pk:
+                pipe.execute_command('TS.ALTER', key, *labels)
+                commands.append(key)
+        results = await pipe.execute(raise_on_error=False) if commands else []
+        for key, result in zip(commands, results):
+            if isinstance(result, Exception):
+                # Time series probably already exists
+                self.logger.info('Could not create timeseries %s, error: %s', key, result)
+        self.created.update(missing)
+
+    async def send(self, samples: List[Sample]) -> List[Tuple[Sample, Exception]]:
+        """Pipelined TS.MADD of `samples`, returns the rejected ones with their per-sample error."""
+        pipe = self.redis.pipeline(transaction=False)
+        chunks = [samples[start:start + self.chunk_size] for start in range(0, len(samples), self.chunk_size)]
+        for chunk in chunks:
+            args = []
+            for key, timestamp, value in chunk:
+                args.extend((key, timestamp, value))
+            pipe.execute_command('TS.MADD', *args)
+        rejected = []
+        for chunk, reply in zip(chunks, await pipe.execute(raise_on_error=False)):
+            results = [reply] * len(chunk) if isinstance(reply, Exception) else reply
+            rejected.extend(
+                (sample, result) for sample, result in zip(chunk, results) if isinstance(result, Exception)
+            )
+        return rejected
+
+    async def write(self, samples: List[Sample]) -> List[Tuple[Sample, Exception]]:
+        """
+        TS.MADD of `samples`, returns the samples Redis rejected (e.g. older than the series RETENTION).
+        Series gone since this writer created them (flushed or rebuilt Redis) are created again, with their
+        fund_pk label, and their samples sent once more.
+        """
+        if not samples:
+            return []
+        s = perf_counter()
+        rejected = await self.send(samples)
+        missing = {sample[0] for sample, error in rejected if "does not exist" in str(error)}
+        if missing:
+            self.logger.warning(f"{len(missing)} series disappeared, creating them again")
+            self.created.difference_update(missing)
+            await self.ensure_many({key: self.fund_pks.get(key) for key in missing})
+            retry = [sample for sample, error in rejected if sample[0] in missing]
+            rejected = [(sample, error) for sample, error in rejected if sample[0] not in missing]
+            rejected.extend(await self.send(retry))
+        elapsed = perf_counter() - s
+        written = len(samples) - len(rejected)
+        self.written += written
+        self.elapsed += elapsed
+        self.logger.debug(
+            f"Wrote {written} samples in {elapsed * 1000:0.1f} ms ({written / elapsed if elapsed else 0:0.0f} samples/s)."
+        )
+        if rejected:
+            by_error = {}
+            for (key, _, _), error in rejected:
+                by_error.setdefault(str(error), set()).add(key)
+            for error, keys in by_error.items():
+                self.logger.error(
+                    f"TS.MADD rejected samples of {len(keys)} series ({', '.join(sorted(keys)[:5])}): {error}"
+                )
+        return rejected
+
+    async def madd(self, samples: List[Sample]) -> int:
+        """TS.MADD of `samples`, returns how many were written, see `write`."""
+        return len(samples) - len(await self.write(samples))
+
+    async def write_entries(self, key_value_pairs: Tuple, data: list, fund_pk: Optional[str] = None) -> int:
+        """
+        Add many samples to several timeseries keys.
+        `key_value_pairs` is an iterable of tuples containing in the 0th position the
+        timestamp key into which to insert entries and the 1th position the name
+        of the attribute of each `data` entry holding the sample.
+        """
+        samples = []
+        for entry in data:
+            timestamp = int(entry.timestamp.timestamp())
+            for timeseries_key, attr in key_value_pairs:
+                point = getattr(entry, attr)
+                v = str(point.quantize(Decimal("1.000000000"))) if isinstance(point, Decimal) else point
+                samples.append((timeseries_key, timestamp, v))
+        await self.ensure_series((key for key, _ in key_value_pairs), fund_pk)
+        return await self.madd(samples)
+
+    def samples_per_second(self) -> float:
+        return self.written / self.elapsed if self.elapsed else 0.0
@@ -0,0 +1,102 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from columnar import decode_samples
+
+TRADING_DAYS = 252
+
+
+def period_return(start_index: float, end_index: float) -> float:
+    """Return between two points of a cumulative log index."""
+    return float(np.expm1(end_index - start_index))
+
+
+def annualized_volatility(log_returns: np.ndarray) -> Optional[float]:
+    if len(log_returns) < 2:
+        return None
+    return float(np.std(log_returns, ddof=1) * np.sqrt(TRADING_DAYS))
+
+
+def max_drawdown(cumulative_index: np.ndarray) -> Optional[float]:
+    """Deepest fall from a previous peak along a cumulative log index, as a negative return."""
+    if len(cumulative_index) == 0:
+        return None
+    return float(np.min(np.expm1(cumulative_index - np.maximum.accumulate(cumulative_index))))
+
+
+def window_analytics(anchor, index_samples: list, return_samples: list, cdi_start, cdi_end) -> dict:
+    """Analytics of a window from the derived series replies.
+
+    `anchor` is the cumulative index point at or before the window start, `index_samples` and `return_samples`
+    the derived samples inside the window, `cdi_start`/`cdi_end` the CDI index points at or before its bounds.
+    """
+    timestamps, index = decode_samples(index_samples) if index_samples else (np.empty(0, dtype=np.int64), np.empty(0))
+    if anchor is not None and (len(timestamps) == 0 or int(anchor[0]) < timestamps[0]):
+        timestamps = np.concatenate(([int(anchor[0])], timestamps))
+        index = np.concatenate(([float(anchor[1])], index))
+    if len(index) == 0:
+        return {}
+    log_returns = np.empty(0)
+    if return_samples:
+        return_timestamps, log_returns = decode_samples(return_samples)
+        # the return of the first point comes from before the window
+        log_returns = log_returns[return_timestamps > timestamps[0]]
+    analytics = {
+        "start": int(timestamps[0]),
+        "end": int(timestamps[-1]),
+        "period_return": period_return(index[0], index[-1]),
+        "annualized_volatility": annualized_volatility(log_returns),
+        "max_drawdown": max_drawdown(index),
+    }
+    if cdi_start is not None and cdi_end is not None:
+        cdi_return = period_return(float(cdi_start[1]), float(cdi_end[1]))
+        analytics["cdi_return"] = cdi_return
+        analytics["excess_return"] = analytics["period_return"] - cdi_return
+        analytics["percent_of_cdi"] = analytics["period_return"] / cdi_return * 100 if cdi_return else None
+    return analytics
+
+
+def align_values(series: Dict[str, Optional[list]]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Quotes of several funds as a (dates x funds) matrix on the union of their quote dates.
+
+    Missing days are forward filled and the index starts on the first date every fund has a quote.
+    Funds without quotes are left out of the returned documents.
+    """
+    documents = [document for document, samples in series.items() if samples]
+    decoded = [decode_samples(series[document]) for document in documents]
+    if not decoded:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0)), documents
+    timestamps = np.unique(np.concatenate([ts for ts, _ in decoded]))
+    matrix = np.full((len(timestamps), len(decoded)), np.nan)
+    for column, (ts, values) in enumerate(decoded):
+        position = np.searchsorted(ts, timestamps, side="right") - 1
+        quoted = position >= 0
+        matrix[quoted, column] = values[position[quoted]]
+    complete = ~np.isnan(matrix).any(axis=1)
+    start = int(np.argmax(complete)) if complete.any() else len(timestamps)
+    return timestamps[start:], matrix[start:], documents
+
+
+def finite_list(array: np.ndarray) -> list:
+    return np.where(np.isfinite(array), array, None).tolist()
+
+
+def compare(timestamps: np.ndarray, matrix: np.ndarray) -> dict:
+    """Cumulative returns from the first common date and the covariance/correlation of the daily log returns."""
+    if len(timestamps) == 0:
+        return {"timestamp": [], "cumulative_returns": [], "covariance": None, "correlation": None}
+    cumulative = matrix / matrix[0] - 1
+    log_returns = np.diff(np.log(matrix), axis=0)
+    covariance = correlation = None
+    if len(log_returns) >= 2:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = np.atleast_2d(np.cov(log_returns, rowvar=False))
+            deviation = np.sqrt(np.diag(covariance))
+            correlation = covariance / np.outer(deviation, deviation)
+    return {
+        "timestamp": timestamps.tolist(),
+        "cumulative_returns": finite_list(cumulative.T),
+        "covariance": finite_list(covariance) if covariance is not None else None,
+        "correlation": finite_list(correlation) if correlation is not None else None,
+    }
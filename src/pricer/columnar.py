@@ -0,0 +1,149 @@
+import datetime
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from schemas.funds import TimeSeriesModel
+from ts_writer import series_labels
+
+# series key metric -> TimeSeriesModel attribute
+METRIC_ATTRS = {"value": "value", "owners": "owners", "networth": "net_worth"}
+COLUMNS = ("value", "owners", "net_worth")
+# aggregation of a compacted quote series -> optional quote range column
+RANGE_ATTRS = {"min": "low", "max": "high"}
+RANGE_COLUMNS = ("low", "high")
+
+
+def metric_of(key: str, prefix: str = "PRICER_") -> str:
+    return key[len(prefix):].partition("_")[0]
+
+
+def column_of(key: str) -> Optional[str]:
+    """Frame column a cached series fills, the monthly min/max quotes go to low/high instead of value."""
+    labels = series_labels(key)
+    if labels["metric"] == "value" and labels.get("aggregation") in RANGE_ATTRS:
+        return RANGE_ATTRS[labels["aggregation"]]
+    return METRIC_ATTRS.get(labels["metric"])
+
+
+def decode_samples(samples: list) -> Tuple[np.ndarray, np.ndarray]:
+    """TS.RANGE reply [[timestamp, "value"], ...] as (int64 timestamps, float64 values)."""
+    timestamps = np.fromiter((sample[0] for sample in samples), dtype=np.int64, count=len(samples))
+    values = np.array([sample[1] for sample in samples], dtype=np.float64)
+    return timestamps, values
+
+
+@dataclass
+class SeriesFrame:
+    """Fund series aligned by timestamp, one float64 array per metric with NaN for missing samples.
+
+    `low`/`high` are only set for monthly frames, read from the min/max compacted quote series.
+    """
+    timestamp: np.ndarray
+    value: np.ndarray
+    owners: np.ndarray
+    net_worth: np.ndarray
+    low: Optional[np.ndarray] = None
+    high: Optional[np.ndarray] = None
+
+    @classmethod
+    def empty(cls) -> "SeriesFrame":
+        return cls(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in COLUMNS))
+
+    @classmethod
+    def from_points(cls, points: list) -> "SeriesFrame":
+        """Frame of scraped or decoded points (objects with timestamp/value/owners/net_worth), sorted by timestamp."""
+        if not points:
+            return cls.empty()
+        timestamps = np.fromiter((int(p.timestamp.timestamp()) for p in points), dtype=np.int64, count=len(points))
+        order = np.argsort(timestamps, kind="stable")
+        values = np.array([float(p.value) for p in points])
+        owners = np.array([np.nan if p.owners is None else p.owners for p in points], dtype=np.float64)
+        net_worth = np.array([np.nan if p.net_worth is None else p.net_worth for p in points], dtype=np.float64)
+        return cls(timestamps[order], values[order], owners[order], net_worth[order])
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    @property
+    def ranges(self) -> Tuple[str, ...]:
+        """Names of the low/high columns this frame carries."""
+        return tuple(name for name in RANGE_COLUMNS if getattr(self, name) is not None)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ("timestamp",) + COLUMNS + self.ranges)
+
+    def slice(self, from_ts: int = None, to_ts: int = None) -> "SeriesFrame":
+        start = np.searchsorted(self.timestamp, from_ts, side="left") if from_ts is not None else 0
+        end = np.searchsorted(self.timestamp, to_ts, side="right") if to_ts is not None else len(self)
+        return SeriesFrame(
+            *(getattr(self, name)[start:end] for name in ("timestamp",) + COLUMNS),
+            **{name: getattr(self, name)[start:end] for name in self.ranges}
+        )
+
+    def last_on_or_before(self, timestamp: int) -> Optional[int]:
+        """Index of the last point at or before `timestamp`, None when the history starts after it."""
+        position = int(np.searchsorted(self.timestamp, timestamp, side="right")) - 1
+        return position if position >= 0 else None
+
+    @staticmethod
+    def nullable(column: np.ndarray, cast) -> list:
+        return [None if v != v else cast(v) for v in column.tolist()]
+
+    def to_models(self) -> List[TimeSeriesModel]:
+        """Build the response models in bulk, already validated data so pydantic validation is skipped."""
+        timestamps = map(datetime.datetime.fromtimestamp, self.timestamp.tolist())
+        values = (Decimal(repr(v)) for v in self.value.tolist())
+        owners = self.nullable(self.owners, int)
+        net_worth = self.nullable(self.net_worth, float)
+        return [
+            TimeSeriesModel.construct(timestamp=t, value=v, owners=o, net_worth=n)
+            for t, v, o, n in zip(timestamps, values, owners, net_worth)
+        ]
+
+    def records(self) -> Iterator[dict]:
+        """JSON ready points, value as float like `EnhancedJSONEncoder` renders Decimals."""
+        timestamps = map(datetime.datetime.fromtimestamp, self.timestamp.tolist())
+        owners = self.nullable(self.owners, int)
+        net_worth = self.nullable(self.net_worth, float)
+        ranges = {name: self.nullable(getattr(self, name), float) for name in self.ranges}
+        for i, (t, v, o, n) in enumerate(zip(timestamps, self.value.tolist(), owners, net_worth)):
+            record = {"timestamp": t.isoformat(), "value": v, "owners": o, "net_worth": n}
+            for name, column in ranges.items():
+                record[name] = column[i]
+            yield record
+
+
+def frame_from_cached(cached: Dict[str, Optional[list]]) -> Optional[SeriesFrame]:
+    """Align the cached series of a fund ({key: TS.RANGE samples}) on the union of their timestamps.
+
+    Points without a quote value are dropped, missing owners/net worth are NaN. The low/high columns
+    are only set when their min/max series were requested.
+    """
+    decoded = {}
+    requested = set()
+    for key, samples in cached.items():
+        name = column_of(key)
+        if name is None:
+            continue
+        requested.add(name)
+        if samples:
+            decoded[name] = decode_samples(samples)
+    if "value" not in decoded:
+        return None
+    timestamps = np.unique(np.concatenate([ts for ts, _ in decoded.values()]))
+    columns = {}
+    for name in COLUMNS + RANGE_COLUMNS:
+        column = np.full(len(timestamps), np.nan)
+        if name in decoded:
+            ts, values = decoded[name]
+            column[np.searchsorted(timestamps, ts)] = values
+        columns[name] = column
+    has_value = ~np.isnan(columns["value"])
+    return SeriesFrame(
+        timestamps[has_value], *(columns[name][has_value] for name in COLUMNS),
+        **{name: columns[name][has_value] for name in RANGE_COLUMNS if name in requested}
+    )
@@ -0,0 +1,118 @@
+import json
+from typing import Callable, Dict, Optional
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+
+from columnar import SeriesFrame
+from redis.connector import EnhancedJSONEncoder
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.pricer.columnar+json"
+MSGPACK = "application/x-msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+ARROW_FILE = "application/vnd.apache.arrow.file"
+ALIASES = {"application/msgpack": MSGPACK}
+WILDCARDS = ("*/*", "application/*")
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """Best supported media type of an Accept header, JSON when absent, None when nothing matches."""
+    if not accept:
+        return JSON
+    ranked = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranked.append((-quality, position, media_type.strip().lower()))
+    for _, _, media_type in sorted(ranked):
+        media_type = ALIASES.get(media_type, media_type)
+        if media_type in ENCODERS:
+            return media_type
+        if media_type in WILDCARDS:
+            return JSON
+    return None
+
+
+def columns(frame: SeriesFrame) -> dict:
+    """Parallel arrays, timestamps as epoch seconds and null for missing samples."""
+    body = {
+        "timestamp": frame.timestamp.tolist(),
+        "value": frame.value.tolist(),
+        "owners": SeriesFrame.nullable(frame.owners, int),
+        "net_worth": SeriesFrame.nullable(frame.net_worth, float),
+    }
+    for name in frame.ranges:
+        body[name] = SeriesFrame.nullable(getattr(frame, name), float)
+    return body
+
+
+def encode_json(header: dict, frame: SeriesFrame) -> bytes:
+    body = dict(header, timeseries=list(frame.records()))
+    return json.dumps(body, separators=(",", ":"), cls=EnhancedJSONEncoder).encode()
+
+
+def encode_columnar_json(header: dict, frame: SeriesFrame) -> bytes:
+    body = dict(header, timeseries=columns(frame))
+    return json.dumps(body, separators=(",", ":"), cls=EnhancedJSONEncoder).encode()
+
+
+def encode_msgpack(header: dict, frame: SeriesFrame) -> bytes:
+    header = json.loads(json.dumps(header, cls=EnhancedJSONEncoder))
+    return msgpack.packb(dict(header, timeseries=columns(frame)))
+
+
+def arrow_table(header: dict, frame: SeriesFrame) -> pa.Table:
+    """Points as an Arrow table, the fund header travels as JSON in the schema metadata."""
+    owners_missing = np.isnan(frame.owners)
+    arrays = {
+        "timestamp": pa.array(frame.timestamp, type=pa.timestamp("s")),
+        "value": pa.array(frame.value, type=pa.float64()),
+        "owners": pa.array(np.where(owners_missing, 0, frame.owners).astype(np.int64), mask=owners_missing),
+        "net_worth": pa.array(frame.net_worth, mask=np.isnan(frame.net_worth), type=pa.float64()),
+    }
+    for name in frame.ranges:
+        column = getattr(frame, name)
+        arrays[name] = pa.array(column, mask=np.isnan(column), type=pa.float64())
+    table = pa.table(arrays, metadata={"fund": json.dumps(header, cls=EnhancedJSONEncoder)})
+    return table
+
+
+def encode_arrow(header: dict, frame: SeriesFrame) -> bytes:
+    """Arrow IPC stream, read with pa.ipc.open_stream."""
+    table = arrow_table(header, frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_arrow_file(header: dict, frame: SeriesFrame) -> bytes:
+    """Arrow IPC file (random access format), read with pa.ipc.open_file."""
+    table = arrow_table(header, frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS: Dict[str, Callable[[dict, SeriesFrame], bytes]] = {
+    JSON: encode_json,
+    COLUMNAR_JSON: encode_columnar_json,
+    MSGPACK: encode_msgpack,
+    ARROW: encode_arrow,
+    ARROW_FILE: encode_arrow_file,
+}
+
+
+def encode(media_type: str, header: dict, frame: SeriesFrame) -> bytes:
+    return ENCODERS[media_type](header, frame)
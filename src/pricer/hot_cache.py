@@ -0,0 +1,140 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import aioredis as redis
+
+from columnar import SeriesFrame
+from settings import Settings, logger
+
+settings = Settings()
+
+CLEAR_ALL = "*"
+
+
+@dataclass
+class CachedFund:
+    model: dict
+    frame: Optional[SeriesFrame]
+    nbytes: int
+
+
+class HotFundCache:
+    """In-process LRU of fund metadata and aligned series, bounded by `max_bytes`.
+
+    Entries are dropped when a worker or replica publishes the document on the invalidation channel,
+    and the whole cache is dropped whenever the subscription is lost.
+    """
+
+    def __init__(self, max_bytes: int = None, channel: str = None):
+        self.logger = logger
+        self.max_bytes = max_bytes if max_bytes is not None else settings.hot_cache_max_bytes
+        self.channel = channel if channel is not None else settings.invalidation_channel
+        self.entries: "OrderedDict[str, CachedFund]" = OrderedDict()
+        self.nbytes = 0
+        # bumped on every invalidation, a load started before one must not be stored
+        self.generation = 0
+        self.listening = False
+        # (document, generation) -> load in flight, concurrent misses share it
+        self.loading: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, document: str) -> Optional[CachedFund]:
+        cached = self.entries.get(document) if self.listening else None
+        if cached is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(document)
+        self.hits += 1
+        return cached
+
+    def put(self, document: str, model: dict, frame: Optional[SeriesFrame], generation: int) -> CachedFund:
+        # metadata is a few hundred bytes, the series arrays dominate
+        cached = CachedFund(model=model, frame=frame, nbytes=1024 + (frame.nbytes if frame is not None else 0))
+        if generation != self.generation or not self.listening or cached.nbytes > self.max_bytes:
+            return cached
+        self.invalidate(document, bump=False)
+        self.entries[document] = cached
+        self.nbytes += cached.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return cached
+
+    async def load(
+            self, document: str, loader: Callable[[int], Awaitable[Optional[CachedFund]]]
+    ) -> Optional[CachedFund]:
+        """Run `loader(generation)` once for concurrent misses of a document, they all await the same load.
+
+        Loads are keyed by generation too, a miss after an invalidation never joins a load started before it.
+        """
+        key = (document, self.generation)
+        flight = self.loading.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(loader(self.generation))
+            self.loading[key] = flight
+            flight.add_done_callback(lambda done: self._forget(key, done))
+        # a cancelled caller must not cancel the load the others are waiting for
+        return await asyncio.shield(flight)
+
+    def _forget(self, key: Tuple[str, int], flight: asyncio.Future):
+        if self.loading.get(key) is flight:
+            del self.loading[key]
+
+    def invalidate(self, document: str, bump: bool = True):
+        if bump:
+            self.generation += 1
+        cached = self.entries.pop(document, None)
+        if cached is not None:
+            self.nbytes -= cached.nbytes
+
+    def clear(self):
+        self.generation += 1
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "funds": len(self.entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "listening": self.listening,
+            "loading": len(self.loading),
+        }
+
+    async def listen(self, redis_client: redis.Redis, retry_interval: float = 5.0, poll_timeout: float = 1.0):
+        """Apply invalidations until cancelled, serving nothing from memory while unsubscribed.
+
+        Any error drops the whole cache and subscribes again after `retry_interval`.
+
+        Messages are polled with a `poll_timeout` shorter than the pool socket timeout, an idle channel is not
+        an error: the pool health check pings the subscription connection.
+        """
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                self.listening = True
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=poll_timeout)
+                    if message is None or message["type"] != "message":
+                        continue
+                    if message["data"] == CLEAR_ALL:
+                        self.clear()
+                    else:
+                        self.invalidate(message["data"])
+            except Exception as e:
+                # whatever broke, invalidations published until the next subscription are never seen
+                self.logger.error(f"Invalidation channel lost, dropping hot cache: {e!r}")
+            finally:
+                self.listening = False
+                self.clear()
+                try:
+                    await pubsub.reset()
+                except Exception as e:
+                    self.logger.error(f"Could not reset the invalidation subscription: {e!r}")
+            await asyncio.sleep(retry_interval)
@@ -0,0 +1,107 @@
+from datetime import date, datetime
+from typing import List, Union
+from urllib.parse import urljoin
+
+import httpx
+from fastapi import HTTPException
+
+from cvm_page import HEADERS, anchor_href, hidden_fields, month_options, span_text
+from scrapper import Scrapper
+from scrapper_models import TimeSeries, FundTS
+from settings import Settings
+
+settings = Settings()
+
+FUND_LINK_TARGET = "ddlFundos$_ctl0$lnkbtn1"
+
+
+class HttpScrapper(Scrapper):
+    """Same flow as `Scrapper` replaying the CVM ASP.NET postbacks with httpx instead of Chrome.
+
+    Selected with SCRAPER_ENGINE=http.
+    """
+
+    def new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(headers=HEADERS, timeout=settings.http_timeout, follow_redirects=True)
+
+    async def get_funds_details(
+            self,
+            document_number: str,
+            client: httpx.AsyncClient
+    ) -> str:
+        search = await client.get(settings.cvm_url + document_number)  # url = CVM + CNPJ
+        search.raise_for_status()
+        form = hidden_fields(search.text)
+        form["__EVENTTARGET"] = FUND_LINK_TARGET
+        form["__EVENTARGUMENT"] = ""
+        details = await client.post(str(search.url), data=form)
+        details.raise_for_status()
+        self.logger.debug("Success executed postback!")
+        self.fund_ts_model.fund_pk = self.get_fund_pk(str(details.url))
+        self.fund_ts_model.fund_name = span_text(details.text, "lbNmDenomSocial")
+        self.fund_ts_model.released_on = datetime.strptime(span_text(details.text, "lbInfAdc1"), '%d/%m/%Y').date()
+        self.fund_ts_model.active = span_text(details.text, "lbSitDesc") == "EM FUNCIONAMENTO NORMAL"
+        # Lâmina de cotas diárias
+        fund_daily_link = anchor_href(details.text, "Hyperlink2")
+        if fund_daily_link is None:
+            return settings.cvm_fund_url % self.fund_ts_model.fund_pk
+        return urljoin(str(details.url), fund_daily_link)
+
+    async def parse_table(
+            self,
+            client: httpx.AsyncClient,
+            link: str,
+            from_date: Union[date, None] = None,
+            end_date: Union[date, None] = None
+    ) -> List[TimeSeries]:
+        response = await client.get(link)
+        response.raise_for_status()
+        months = [month_year for _, month_year, _ in month_options(response.text)]
+        selectors_filtered = self.filter_limit_date(months, from_date, end_date)
+        self.logger.debug(f"Found {len(selectors_filtered)} months to scrap")
+        await self.publish_to_queue(selectors_filtered)
+        return []
+
+    async def update_fund_data(self, fund_id: str, from_date: str, document: str = None) -> list[TimeSeries]:
+        timeseries = None
+        self.fund_ts_model.fund_pk = fund_id
+        self.fund_ts_model.document = document
+        from_date = datetime.fromisoformat(from_date) if isinstance(from_date, str) else None
+        async with self.new_client() as client:
+            time_series: list = await self.parse_table(
+                client=client,
+                from_date=from_date,
+                link=settings.cvm_fund_url % fund_id
+            )
+            if len(time_series) > 0:
+                timeseries = sorted(time_series)
+
+        return timeseries
+
+    async def get_fund_data(
+            self,
+            document_number: Union[str, None] = None,
+            fund_pk: Union[str, None] = None,
+            from_date: Union[date, str, None] = None,
+            end_date: Union[date, str, None] = None
+    ) -> FundTS:
+        if document_number is None and fund_pk is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Document Number or Fund Pk must be used to parse a fund detail"
+                )
+        if from_date is not None:
+            from_date = from_date if hasattr(from_date, "strftime") else self.str_2_date(from_date)
+        if end_date is not None:
+            end_date = end_date if hasattr(end_date, "strftime") else self.str_2_date(end_date)
+        async with self.new_client() as client:
+            if document_number:
+                self.fund_ts_model.document = document_number
+                link = await self.get_funds_details(document_number, client)
+            else:
+                link = settings.cvm_fund_url % fund_pk
+            time_series: list = await self.parse_table(client, link, from_date, end_date)
+
+            self.fund_ts_model.timeseries = sorted(time_series) if time_series is not None else None
+
+        return self.fund_ts_model
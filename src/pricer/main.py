@@ -1,20 +1,38 @@
 # This Redis instance is tuned for durability.
+import asyncio
+import dataclasses
 import datetime
+import hashlib
+import json
+from contextlib import aclosing
 from decimal import Decimal
 from functools import wraps
 from time import perf_counter
-from typing import List
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 
-from redis.connector import redis_url, RedisConnector, Keys
-from schemas.funds import RequestQuery, ResponseQuery, TimeSeriesModel, StreamingSchema, ResponseQuote
+from analytics import align_values, compare, window_analytics
+from columnar import SeriesFrame, frame_from_cached
+from formats import JSON, encode, negotiate
+from hot_cache import CachedFund, HotFundCache
+from http_scrapper import HttpScrapper
+from redis.connector import redis_url, RedisConnector, Keys, EnhancedJSONEncoder, create_pool, pool_stats
+from schemas.funds import (
+    RequestQuery, ResponseQuery, StreamingSchema, ResponseQuote, RequestPortfolio, ResponsePortfolio,
+    PositionValuation, ResponseAnalytics, Resolution, RequestCompare
+)
 from scrapper import Scrapper
 from scrapper_models import TimeSeries, FundTS
 from settings import Settings, logger
+from singleflight import SingleFlight
 
 settings = Settings()
 app = application = FastAPI()
+fund_flights = SingleFlight()
+hot_cache = HotFundCache()
 
 
 # timer
@@ -37,23 +55,56 @@ def timeit(func):
     return wrapper
 
 
+def build_scrapper(redis: RedisConnector = None, job_id: str = None) -> Scrapper:
+    if settings.scraper_engine == "http":
+        return HttpScrapper(logger=logger, redis=redis, job_id=job_id)
+    return Scrapper(logger=logger, redis=redis, job_id=job_id)
+
+
+def get_redis(request: Request) -> RedisConnector:
+    return RedisConnector(request.app.state.redis_pool, request.app.state.created_series)
+
+
 # Scrapping
 @timeit
-async def scrapping(data: RequestQuery) -> FundTS:
-    scrapper = Scrapper(logger=logger)
-    result = await scrapper.get_fund_data(
-        document_number=data.document,
-        from_date=data.from_date
-    )
+async def scrapping(data: RequestQuery, redis: RedisConnector = None) -> FundTS:
+    scrapper = build_scrapper(redis)
+    try:
+        result = await scrapper.get_fund_data(
+            document_number=data.document,
+            from_date=data.from_date
+        )
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout while scrapping fund {data.document}")
+        raise HTTPException(status_code=504, detail=f"Timeout while getting fund {data.document} from CVM")
 
     return result
 
 
+async def scrapping_once(data: RequestQuery, redis: RedisConnector) -> FundTS:
+    """`scrapping` shared by concurrent queries of the same document, in this process and across replicas."""
+    async def lead() -> FundTS:
+        fund = await scrapping(data, redis)
+        if fund:
+            # replicas waiting on the lock read the fund from the cache once it is released
+            await redis.set_cache(dataclasses.replace(fund))
+        return fund
+
+    async def follow() -> FundTS | None:
+        cached = await redis.get_cached_model(data.document)
+        return await dict_2_fund_model(cached) if cached else None
+
+    try:
+        fund = await fund_flights.do(f"scrape_{data.document}", lead, follow, redis.redis)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Timeout waiting for fund {data.document} from another request")
+    # every caller gets its own copy, the endpoints fill it in
+    return dataclasses.replace(fund) if fund else fund
+
+
 @timeit
-async def update_fund_data(data: FundTS) -> FundTS | None:
-    if data.timeseries is None:
-        data.last_query_date = None
-    scrapper = Scrapper(logger=logger)
+async def update_fund_data(data: FundTS, redis: RedisConnector = None) -> FundTS | None:
+    scrapper = build_scrapper(redis)
     result: List[TimeSeries] = await scrapper.update_fund_data(
         fund_id=data.fund_pk,
         from_date=data.last_query_date,
@@ -86,112 +137,106 @@ async def dict_2_fund_model(cached_data: dict) -> FundTS:
     return cached_model
 
 
-@timeit
-async def dict_2_timeseries_model(cached_data: dict, key_list: list) -> List[TimeSeriesModel] | None:
-    key_list_length = len(key_list)
-    owners_key = True if any("owners_" in key for key in key_list) else None
-    networth_key = True if any("networth_" in key for key in key_list) else None
-    time_series_list = []
-    if cached_data[key_list[0]] is None:
-        return None
-    length = len(cached_data[key_list[0]])
-    for i in range(length):
-        if key_list_length == 1:
-            time_series = TimeSeriesModel(
-                timestamp=datetime.datetime.fromtimestamp(cached_data[key_list[0]][i][0]),
-                value=Decimal(cached_data[key_list[0]][i][1]),
-                net_worth=0,
-                owners=0
-            )
-            time_series_list.append(time_series)
-        elif key_list_length == 2 and owners_key:
-            time_series = TimeSeriesModel(
-                timestamp=datetime.datetime.fromtimestamp(cached_data[key_list[0]][i][0]),
-                value=Decimal(cached_data[key_list[0]][i][1]),
-                net_worth=0,
-                owners=int(cached_data[key_list[-1]][i][1])
-            )
-            time_series_list.append(time_series)
-        elif key_list_length == 2 and networth_key:
-            time_series = TimeSeriesModel(
-                timestamp=datetime.datetime.fromtimestamp(cached_data[key_list[0]][i][0]),
-                value=cached_data[key_list[0]][i][0],
-                net_worth=cached_data[key_list[-1]][i][1],
-                owners=0
-            )
-            time_series_list.append(time_series)
-        else:
-            time_series = TimeSeriesModel(
-                timestamp=datetime.datetime.fromtimestamp(cached_data[key_list[0]][i][0]),
-                value=cached_data[key_list[0]][i][0],
-                net_worth=cached_data[key_list[-1]][i][1],
-                owners=int(cached_data[key_list[1]][i][1])
-            )
-            time_series_list.append(time_series)
-    return time_series_list.sort(key=lambda x: x.timestamp)
-
-
 @app.on_event("startup")
 async def startup():
-    logger.info(f"Starting Redis connection on: {redis_url}")
-    redis = RedisConnector()
+    logger.info(f"Starting Redis connection pool on: {redis_url}")
+    app.state.redis_pool = create_pool()
+    # series known to exist, shared by the writers of every request
+    app.state.created_series = set()
+    redis = RedisConnector(app.state.redis_pool)
     redis = await redis.is_redis_available()
     if not redis:
         logger.fatal("Redis server not available")
         raise HTTPException(
             status_code=403, detail=f"Redis service is unavailable!"
         )
+    app.state.invalidation_task = asyncio.create_task(
+        hot_cache.listen(RedisConnector(app.state.redis_pool).redis)
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.invalidation_task.cancel()
+    logger.info(f"Hot fund cache: {hot_cache.stats()}")
+    logger.info(f"Closing Redis connection pool: {pool_stats(app.state.redis_pool)}")
+    await app.state.redis_pool.disconnect()
+
+
+@app.get("/v1/health/redis")
+async def redis_health(request: Request):
+    return pool_stats(request.app.state.redis_pool)
+
+
+@app.get("/v1/health/cache")
+async def cache_health():
+    return hot_cache.stats()
+
+
+async def load_hot_fund(document: str, redis: RedisConnector) -> CachedFund | None:
+    """Fund metadata and whole history, from memory for hot funds, otherwise loaded once from Redis."""
+    cached = hot_cache.get(document)
+    if cached is not None:
+        return cached
+
+    async def load(generation: int) -> CachedFund | None:
+        model = await redis.get_cached_model(document)
+        if not model:
+            return None
+        frame = frame_from_cached(await redis.get_fund_timeseries(document))
+        return hot_cache.put(document, model, frame, generation)
+
+    return await hot_cache.load(document, load)
 
 
 @app.post("/v1/funds", response_model=ResponseQuery)
-async def query_funds(query: RequestQuery, background_tasks: BackgroundTasks):
+async def query_funds(
+        query: RequestQuery,
+        request: Request,
+        background_tasks: BackgroundTasks,
+        redis: RedisConnector = Depends(get_redis)
+):
+    media_type = accepted_media_type(request)
     logger.debug("Getting fund with CNPJ %s data" % query.document)
-    redis = RedisConnector()  # add to fastapi depends
     fund: dict = await redis.get_cached_model(query.document)
     if fund:
         logger.debug("Cached data found, updating")
         fund: FundTS = await dict_2_fund_model(fund)
-        keys = Keys().timeseries_keys(fund.document)
-        cached_ts = await redis.get_cached_timeseries(keys)
-        if cached_ts is not None or all(d for d in cached_ts):
-            timeseries: List[TimeSeriesModel] = await dict_2_timeseries_model(cached_ts, keys)
-            if timeseries is None or timeseries[-1].timestamp != datetime.datetime.now():
-                fund.timeseries = timeseries
-                timeseries: FundTS = await update_fund_data(fund)
-        else:
-            logger.debug("Data already exists for fund updating")
-            timeseries: FundTS = await update_fund_data(fund)
-        fund.timeseries = timeseries
+        # the cached history is encoded straight from the Redis reply, new months are published to the queue
+        frame = frame_from_cached(await redis.get_fund_timeseries(fund.document))
+        today = redis.convert_date(datetime.datetime.combine(datetime.date.today(), datetime.time()))
+        if not frame:
+            # no history yet, publish every month
+            fund.last_query_date = None
+        if not frame or frame.timestamp[-1] != today:
+            await update_fund_data(fund, redis)
     else:
         logger.debug("Fund not fund in database getting all data")
-        fund: FundTS = await scrapping(query)
+        fund: FundTS = await scrapping_once(query, redis)
         if not fund:
             raise HTTPException(
                 status_code=400, detail=f"Fund not found with document_number {query.document}"
             )
+        frame = None
+        if fund.timeseries:
+            frame = SeriesFrame.from_points(fund.timeseries)
+            background_tasks.add_task(redis.persist_timeseries, fund.document, fund.timeseries)
 
-    logger.debug("All data retrieved, creating models")
+    logger.debug("All data retrieved, creating response")
     first_date = None
-    timeseries = None
-    value_ts = fund.timeseries
-    if isinstance(value_ts, list) and len(value_ts) >= 1:
-        first_date = value_ts[0].timestamp
+    if frame:
+        first_date = datetime.datetime.fromtimestamp(int(frame.timestamp[0]))
         fund.first_query_date = first_date
-        fund.last_query_date = value_ts[-1].timestamp
-        timeseries = [
-            TimeSeriesModel(
-                timestamp=entry.timestamp,
-                value=entry.value,
-                owners=entry.owners,
-                net_worth=entry.net_worth
-
-            ) for entry in value_ts
-        ]
-        background_tasks.add_task(redis.persist_timeseries(fund.document, timeseries))
-        del value_ts
+        fund.last_query_date = datetime.datetime.fromtimestamp(int(frame.timestamp[-1]))
     await redis.set_cache(fund)
     logger.debug("Creating Response")
+    if media_type != JSON:
+        return Response(
+            encode(media_type, fund_header(fund, first_date), frame or SeriesFrame.empty()), media_type=media_type
+        )
 
+    # pydantic models only for the JSON response
+    timeseries = frame.to_models() if frame else None
     response = ResponseQuery(
         document=fund.document,
         active=fund.active,
@@ -206,9 +251,283 @@ async def query_funds(query: RequestQuery, background_tasks: BackgroundTasks):
     return response
 
 
+def accepted_media_type(request: Request) -> str:
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Not acceptable: {request.headers.get('accept')}")
+    return media_type
+
+
+def fund_header(fund: FundTS, from_date=None) -> dict:
+    return {
+        "document": fund.document,
+        "active": fund.active,
+        "fund_id": fund.fund_pk,
+        "fund_released_on": fund.released_on,
+        "fund_name": fund.fund_name,
+        "from_date": from_date if from_date is not None else fund.first_query_date,
+    }
+
+
+@app.get("/v1/funds/{document}")
+async def get_fund_timeseries(
+        document: str,
+        request: Request,
+        from_date: str = None,
+        to_date: str = None,
+        resolution: Resolution = Resolution.daily,
+        redis: RedisConnector = Depends(get_redis)
+):
+    """Cached history of a fund, as JSON, columnar JSON, MessagePack or Arrow IPC depending on Accept.
+
+    Weekly and monthly resolutions read the compacted series: weekly last quote, monthly last quote,
+    lowest/highest quote (`low`/`high` columns) and average net worth.
+    """
+    media_type = accepted_media_type(request)
+    if resolution == Resolution.daily:
+        cached = await load_hot_fund(document, redis)
+        if cached is None:
+            raise HTTPException(status_code=404, detail=f"Fund with CNPJ {document} not found")
+        model = cached.model
+        frame = (cached.frame or SeriesFrame.empty()).slice(
+            redis.convert_date(from_date) if from_date else None,
+            redis.convert_date(to_date) if to_date else None
+        )
+    else:
+        cached = hot_cache.get(document)
+        model = cached.model if cached is not None else await redis.get_cached_model(document)
+        if not model:
+            raise HTTPException(status_code=404, detail=f"Fund with CNPJ {document} not found")
+        keys = Keys().resolution_keys(document, resolution.value)
+        frame = frame_from_cached(await redis.get_cached_timeseries(keys, from_date, to_date)) or SeriesFrame.empty()
+    fund: FundTS = await dict_2_fund_model(model)
+    return Response(encode(media_type, fund_header(fund), frame), media_type=media_type)
+
+
+@app.get("/v1/funds/{document}/analytics", response_model=ResponseAnalytics)
+async def fund_analytics(
+        document: str, from_date: str = '', to_date: str = '', redis: RedisConnector = Depends(get_redis)
+):
+    """Period return, annualised volatility, max drawdown and CDI-relative performance of a window (dd/mm/yyyy),
+    the last 365 days by default."""
+    try:
+        end = datetime.datetime.strptime(to_date, "%d/%m/%Y") if to_date else datetime.datetime.now()
+        start = datetime.datetime.strptime(from_date, "%d/%m/%Y") if from_date else end - datetime.timedelta(days=365)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"date fields must be dd/mm/yyyy")
+    if start > end:
+        raise HTTPException(status_code=404, detail=f"from_date must be before to_date")
+    series = await redis.get_analytics_series(document, redis.convert_date(start), redis.convert_date(end))
+    analytics = window_analytics(**series)
+    if not analytics:
+        raise HTTPException(status_code=404, detail=f"No quotes of fund {document} up to {end:%d/%m/%Y}")
+    return ResponseAnalytics(
+        document=document,
+        from_date=datetime.datetime.fromtimestamp(analytics.pop("start")),
+        to_date=datetime.datetime.fromtimestamp(analytics.pop("end")),
+        **analytics
+    )
+
+
+@app.post("/v1/funds/compare")
+async def compare_funds(comparison: RequestCompare, redis: RedisConnector = Depends(get_redis)):
+    """Cumulative returns of several funds on a common business-day index and the covariance/correlation
+    matrix of their daily log returns, over a window (dd/mm/yyyy) that defaults to the last 365 days."""
+    documents = sorted(set(comparison.documents))
+    if not documents or len(documents) > settings.compare_max_funds:
+        raise HTTPException(status_code=422, detail=f"Compare between 1 and {settings.compare_max_funds} funds")
+    try:
+        # quotes are stamped at midnight, a default window ending today keys the cache the same all day
+        end = (
+            datetime.datetime.strptime(comparison.to_date, "%d/%m/%Y") if comparison.to_date
+            else datetime.datetime.combine(datetime.date.today(), datetime.time())
+        )
+        start = (
+            datetime.datetime.strptime(comparison.from_date, "%d/%m/%Y") if comparison.from_date
+            else end - datetime.timedelta(days=365)
+        )
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"date fields must be dd/mm/yyyy")
+    from_ts, to_ts = redis.convert_date(start), redis.convert_date(end)
+
+    # new quotes move the last sample timestamps, so they never hit an old result
+    last = await redis.get_last_timestamps(documents)
+    digest = hashlib.sha1(
+        json.dumps([documents, from_ts, to_ts, [last[document] for document in documents]]).encode()
+    ).hexdigest()
+    body = await redis.get_comparison(digest)
+    if body is None:
+        series = await redis.get_documents_timeseries(documents, start, end, metrics=("value",))
+        timestamps, matrix, quoted = align_values(
+            {document: series[document][Keys().value_ts(document)] for document in documents}
+        )
+        result = compare(timestamps, matrix)
+        body = json.dumps(
+            {
+                "documents": quoted,
+                "missing": [document for document in documents if document not in quoted],
+                "from_date": start,
+                "to_date": end,
+                "dates": [datetime.date.fromtimestamp(timestamp) for timestamp in result.pop("timestamp")],
+                **result
+            },
+            separators=(",", ":"),
+            cls=EnhancedJSONEncoder
+        )
+        await redis.set_comparison(digest, body)
+    return Response(body, media_type="application/json")
+
+
+async def ndjson_timeseries(header: dict, redis: RedisConnector, from_date: str = None):
+    """Fund header line followed by one line per quote, read and encoded one Redis page at a time."""
+    yield json.dumps(header, separators=(",", ":"), cls=EnhancedJSONEncoder) + "\n"
+    async for cached_ts in redis.iter_fund_timeseries(header["document"], from_date):
+        frame = frame_from_cached(cached_ts)
+        if frame is None:
+            continue
+        yield "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in frame.records())
+
+
+@app.post("/v1/funds/stream")
+async def stream_funds(query: RequestQuery, redis: RedisConnector = Depends(get_redis)):
+    logger.debug("Streaming fund with CNPJ %s data" % query.document)
+    fund: dict = await redis.get_cached_model(query.document)
+    if fund:
+        fund: FundTS = await dict_2_fund_model(fund)
+    else:
+        logger.debug("Fund not fund in database getting all data")
+        fund: FundTS = await scrapping_once(query, redis)
+        if not fund:
+            raise HTTPException(
+                status_code=400, detail=f"Fund not found with document_number {query.document}"
+            )
+        if fund.timeseries:
+            fund.first_query_date = fund.timeseries[0].timestamp
+            fund.last_query_date = fund.timeseries[-1].timestamp
+            await redis.persist_timeseries(fund.document, fund.timeseries)
+        await redis.set_cache(fund)
+
+    return StreamingResponse(
+        ndjson_timeseries(fund_header(fund), redis, query.from_date),
+        media_type="application/x-ndjson"
+    )
+
+
+async def run_scrape_job(job_id: str, query: RequestQuery, redis: RedisConnector):
+    """Background part of a job: find the fund and publish its months, workers report them done or failed."""
+    scrapper = build_scrapper(redis, job_id)
+    try:
+        cached = await redis.get_cached_model(query.document)
+        if cached:
+            fund: FundTS = await dict_2_fund_model(cached)
+            await scrapper.update_fund_data(
+                fund_id=fund.fund_pk,
+                from_date=fund.last_query_date,
+                document=fund.document
+            )
+        else:
+            fund: FundTS = await scrapper.get_fund_data(document_number=query.document, from_date=query.from_date)
+            await redis.set_cache(fund)
+    except Exception as e:
+        logger.error(f"Scrape job {job_id} for fund {query.document} failed: {e}")
+        await redis.update_job(job_id, status="failed", error=getattr(e, "detail", None) or str(e))
+        return
+    await redis.update_job(job_id, status="published", fund_pk=fund.fund_pk)
+
+
+def server_sent_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), cls=EnhancedJSONEncoder)}\n\n"
+
+
+async def job_event_stream(job_id: str, redis: RedisConnector):
+    """Job snapshot first, then worker progress as it happens, closed once the job is done or failed."""
+    async with aclosing(redis.job_events(job_id, settings.sse_heartbeat)) as events:
+        async for event in events:
+            if event is not None:
+                yield server_sent_event("progress", event)
+            job = await redis.get_job(job_id)
+            if job is None:
+                yield server_sent_event("error", {"detail": f"Job {job_id} not found or expired"})
+                return
+            if event is None or job["status"] in ("done", "failed"):
+                yield server_sent_event("status", job)
+            if job["status"] in ("done", "failed"):
+                return
+
+
+@app.post("/v1/jobs", status_code=202)
+async def create_job(
+        query: RequestQuery, background_tasks: BackgroundTasks, redis: RedisConnector = Depends(get_redis)
+):
+    job_id = str(uuid4())
+    await redis.create_job(job_id, query.document)
+    background_tasks.add_task(run_scrape_job, job_id, query, redis)
+    return {
+        "job_id": job_id,
+        "status": "pending",
+        "status_url": f"/v1/jobs/{job_id}",
+        "events_url": f"/v1/jobs/{job_id}/events",
+    }
+
+
+@app.get("/v1/jobs/{job_id}")
+async def get_job(job_id: str, redis: RedisConnector = Depends(get_redis)):
+    job = await redis.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.get("/v1/jobs/{job_id}/events")
+async def job_events(job_id: str, redis: RedisConnector = Depends(get_redis)):
+    if await redis.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return StreamingResponse(
+        job_event_stream(job_id, redis),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def frame_quote(cached: CachedFund, timestamp: int) -> Optional[Tuple[int, str]]:
+    frame = cached.frame
+    index = frame.last_on_or_before(timestamp) if frame is not None else None
+    if index is None:
+        return None
+    return int(frame.timestamp[index]), repr(float(frame.value[index]))
+
+
+async def resolve_quotes(
+        lookups: List[Tuple[str, int]], redis: RedisConnector
+) -> Dict[Tuple[str, int], Optional[Tuple[int, str]]]:
+    """Last quote on or before each (document, timestamp), hot funds from memory and the rest in one pipeline."""
+    quotes = {}
+    missing = []
+    for document, timestamp in dict.fromkeys(lookups):
+        cached = hot_cache.get(document)
+        if cached is not None:
+            quotes[(document, timestamp)] = frame_quote(cached, timestamp)
+        else:
+            missing.append((document, timestamp))
+    if missing:
+        quotes.update(await redis.get_last_quotes(missing))
+    return quotes
+
+
+async def warm_hot_fund(document: str, redis: RedisConnector):
+    # without invalidations the cache is not filled, nor served, until the listener is back
+    if hot_cache.listening:
+        await load_hot_fund(document, redis)
+
+
 @app.get("/v1/funds/quotes/{document}", response_model=ResponseQuote)
-async def get_fund(document: str, investment: float = 0, date: str = ''):
-    redis = RedisConnector()  # add to depends
+async def get_fund(
+        document: str,
+        background_tasks: BackgroundTasks,
+        investment: float = 0,
+        date: str = '',
+        redis: RedisConnector = Depends(get_redis)
+):
     try:
         asked_date = datetime.datetime.strptime(date, "%d/%m/%Y")
     except ValueError:
@@ -218,31 +537,30 @@ async def get_fund(document: str, investment: float = 0, date: str = ''):
     if investment <= 0:
         logger.error(f"Invalid investment field!, {investment}")
         raise HTTPException(status_code=404, detail=f"Investment must be greater than R$ 0, sent {investment}.")
-    try:
-        investment = Decimal(investment)
-        fund: dict = await redis.get_cached_model(document)
+    investment = Decimal(investment)
+    asked_ts = redis.convert_date(asked_date)
 
-    except Exception:
-        raise HTTPException(status_code=404, detail=f"Fund with CNPJ {document} not found")
-
-    if not fund:
-        logger.error("No fund found!")
-        response = "No fund found!"
+    # last quote on or before the asked date, it may fall on a weekend, a holiday or a missing day
+    cached = hot_cache.get(document)
+    if cached is not None:
+        quote = frame_quote(cached, asked_ts)
     else:
-        fund: FundTS = await dict_2_fund_model(fund)
-        fund_key_list = [
-            Keys().value_ts(fund.document),
-            Keys().net_worth_ts(fund.document)
-        ]
-        logger.debug("Fund found, get timeseries")
-        cached_ts = await redis.get_cached_timeseries(fund_key_list, asked_date, asked_date)
-        fund.timeseries = await dict_2_timeseries_model(cached_ts, fund_key_list)
+        quote = await redis.get_last_quote(document, asked_date)
+        if quote is None and not await redis.check_ts_by_key(Keys().fund_key(document)):
+            logger.error("No fund found!")
+            raise HTTPException(status_code=404, detail=f"Fund with CNPJ {document} not found")
+        if hot_cache.listening:
+            background_tasks.add_task(warm_hot_fund, document, redis)
+    if quote is None:
+        raise HTTPException(status_code=404, detail=f"No quote of fund {document} on or before {date}")
 
     logger.debug("Creating response")
-    quote_value = fund.timeseries[0].value
+    quote_ts, quote_value = quote
+    quote_value = Decimal(quote_value)
     response = ResponseQuote(
-        document=fund.document,
+        document=document,
         date=asked_date,
+        quote_date=datetime.datetime.fromtimestamp(quote_ts),
         investment=investment,
         quote_vale_on_date=quote_value,
         number_of_quotes=Decimal(investment / quote_value),
@@ -250,6 +568,70 @@ async def get_fund(document: str, investment: float = 0, date: str = ''):
     return response
 
 
+@app.post("/v1/portfolio/valuation", response_model=ResponsePortfolio)
+async def value_portfolio(portfolio: RequestPortfolio, redis: RedisConnector = Depends(get_redis)):
+    """Units bought by each (document, date, investment) position and, given `valuation_date`, their value on it."""
+    valuation_date = None
+    if portfolio.valuation_date:
+        try:
+            valuation_date = datetime.datetime.strptime(portfolio.valuation_date, "%d/%m/%Y")
+        except ValueError:
+            raise HTTPException(status_code=422, detail=f"valuation_date field must be dd/mm/yyyy")
+    valuation_ts = redis.convert_date(valuation_date) if valuation_date is not None else None
+
+    dated = []
+    lookups = []
+    for position in portfolio.positions:
+        try:
+            asked_date = datetime.datetime.strptime(position.date, "%d/%m/%Y")
+        except ValueError:
+            asked_date = None
+        dated.append((position, asked_date))
+        if asked_date is not None:
+            lookups.append((position.document, redis.convert_date(asked_date)))
+            if valuation_ts is not None:
+                lookups.append((position.document, valuation_ts))
+    quotes = await resolve_quotes(lookups, redis)
+
+    valuations = []
+    total_investment = Decimal(0)
+    total_value = Decimal(0) if valuation_ts is not None else None
+    for position, asked_date in dated:
+        valuation = PositionValuation(document=position.document, date=asked_date, investment=position.investment)
+        valuations.append(valuation)
+        if asked_date is None:
+            valuation.error = "date field must be dd/mm/yyyy"
+            continue
+        if position.investment <= 0:
+            valuation.error = f"Investment must be greater than R$ 0, sent {position.investment}."
+            continue
+        quote = quotes[(position.document, redis.convert_date(asked_date))]
+        if quote is None:
+            valuation.error = f"No quote of fund {position.document} on or before {position.date}"
+            continue
+        valuation.quote_date = datetime.datetime.fromtimestamp(quote[0])
+        valuation.quote_value = Decimal(quote[1])
+        valuation.number_of_quotes = position.investment / valuation.quote_value
+        if valuation_ts is not None:
+            valuation_quote = quotes[(position.document, valuation_ts)]
+            if valuation_quote is None:
+                valuation.error = f"No quote of fund {position.document} on or before {portfolio.valuation_date}"
+                continue
+            valuation.valuation_quote_date = datetime.datetime.fromtimestamp(valuation_quote[0])
+            valuation.valuation_quote_value = Decimal(valuation_quote[1])
+            valuation.value = valuation.number_of_quotes * valuation.valuation_quote_value
+            total_value += valuation.value
+        # both totals cover the same fully valued positions
+        total_investment += position.investment
+
+    return ResponsePortfolio(
+        valuation_date=valuation_date,
+        total_investment=total_investment,
+        total_value=total_value,
+        positions=valuations
+    )
+
+
 # @app.get("/funds/{document}")
 # async def get_fund(document: str, owners: bool = False, networth: bool = False):
 #     redis = RedisConnector()  # add to depends
@@ -0,0 +1,120 @@
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from columnar import decode_samples
+from settings import Settings
+
+settings = Settings()
+
+# archive column -> series key metric
+COLUMN_METRICS = {"value": "value", "owners": "owners", "net_worth": "networth"}
+YEAR_FILE = re.compile(r"year=(\d{4})\.parquet$")
+AGGREGATIONS = {"last": lambda values: values[-1], "min": np.min, "max": np.max, "avg": np.mean}
+
+
+def aggregate(samples: list, bucket: int, aggregation: str) -> list:
+    """Buckets of sorted daily samples as TS.CREATERULE computes them: aligned on the epoch, stamped by their start."""
+    if not samples:
+        return []
+    timestamps, values = decode_samples(samples)
+    starts = timestamps - timestamps % bucket
+    edges = np.flatnonzero(np.diff(starts)) + 1
+    reduce = AGGREGATIONS[aggregation]
+    return [
+        [int(start), str(float(reduce(group)))]
+        for start, group in zip(starts[np.r_[0, edges]], np.split(values, edges))
+    ]
+
+
+class ParquetArchive:
+    """
+    Cold history written by queue/archive.py, ARCHIVE_DIR/document=<doc>/year=<YYYY>.parquet sorted by timestamp.
+    Files are memory-mapped and written in row groups of about a month, only the row groups whose timestamp
+    statistics overlap the asked window are decompressed. Samples come out in the TS.RANGE reply shape so both
+    tiers merge transparently. Blocking, call it through `asyncio.to_thread`.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root if root is not None else settings.archive_dir
+
+    def paths(self, document: str, from_ts: int = 0, to_ts: Optional[int] = None) -> List[str]:
+        folder = os.path.join(self.root, f"document={document}")
+        try:
+            names = os.listdir(folder)
+        except FileNotFoundError:
+            return []
+        first = datetime.fromtimestamp(from_ts).year if from_ts else 0
+        last = datetime.fromtimestamp(to_ts).year if to_ts is not None else 9999
+        years = sorted(int(match[1]) for match in map(YEAR_FILE.match, names) if match)
+        return [os.path.join(folder, f"year={year}.parquet") for year in years if first <= year <= last]
+
+    @staticmethod
+    def row_groups(parquet: pq.ParquetFile, from_ts: int, to_ts: Optional[int]) -> List[int]:
+        column = parquet.schema_arrow.get_field_index("timestamp")
+        groups = []
+        for group in range(parquet.num_row_groups):
+            statistics = parquet.metadata.row_group(group).column(column).statistics
+            if (
+                    statistics is None or not statistics.has_min_max
+                    or (statistics.max >= from_ts and (to_ts is None or statistics.min <= to_ts))
+            ):
+                groups.append(group)
+        return groups
+
+    @staticmethod
+    def slice(table: pa.Table, from_ts: int, to_ts: Optional[int]) -> pa.Table:
+        timestamps = table.column("timestamp").to_numpy()
+        start = int(np.searchsorted(timestamps, from_ts, side="left"))
+        end = int(np.searchsorted(timestamps, to_ts, side="right")) if to_ts is not None else len(timestamps)
+        return table.slice(start, end - start)
+
+    def window(self, path: str, from_ts: int, to_ts: Optional[int]) -> pa.Table:
+        parquet = pq.ParquetFile(path, memory_map=True)
+        groups = self.row_groups(parquet, from_ts, to_ts)
+        if not groups:
+            return parquet.schema_arrow.empty_table()
+        return self.slice(parquet.read_row_groups(groups), from_ts, to_ts)
+
+    @staticmethod
+    def samples(table: pa.Table) -> Dict[str, list]:
+        """metric -> [[timestamp, "value"], ...] of a table, skipping missing values like TS.RANGE does."""
+        timestamps = table.column("timestamp").to_pylist()
+        replies = {}
+        for column, metric in COLUMN_METRICS.items():
+            replies[metric] = [
+                [timestamp, str(value)]
+                for timestamp, value in zip(timestamps, table.column(column).to_pylist())
+                if value is not None
+            ]
+        return replies
+
+    def iter_years(self, document: str, from_ts: int = 0, to_ts: Optional[int] = None) -> Iterator[Dict[str, list]]:
+        """Samples of the window one year file at a time, so memory is bounded by a year of quotes."""
+        for path in self.paths(document, from_ts, to_ts):
+            yield self.samples(self.window(path, from_ts, to_ts))
+
+    def read(self, document: str, from_ts: int = 0, to_ts: Optional[int] = None) -> Dict[str, list]:
+        replies = {metric: [] for metric in COLUMN_METRICS.values()}
+        for year in self.iter_years(document, from_ts, to_ts):
+            for metric, samples in year.items():
+                replies[metric].extend(samples)
+        return replies
+
+    def last_on_or_before(self, document: str, to_ts: int) -> Optional[Tuple[int, str]]:
+        """(timestamp, value) of the last archived quote at or before `to_ts`, newest row group first."""
+        for path in reversed(self.paths(document, 0, to_ts)):
+            parquet = pq.ParquetFile(path, memory_map=True)
+            for group in reversed(self.row_groups(parquet, 0, to_ts)):
+                table = self.slice(parquet.read_row_group(group), 0, to_ts)
+                for timestamp, value in zip(
+                        reversed(table.column("timestamp").to_pylist()), reversed(table.column("value").to_pylist())
+                ):
+                    if value is not None:
+                        return timestamp, str(value)
+        return None
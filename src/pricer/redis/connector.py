@@ -1,18 +1,23 @@
+import asyncio
 import dataclasses
 import datetime
-import functools
 import json
+import math
 from decimal import Decimal
 
-from typing import Optional, Tuple, List
+from typing import AsyncIterator, Dict, Optional, Set, Tuple, List
 from xmlrpc.client import ResponseError
 
 from aioredis.exceptions import ResponseError
 import aioredis as redis
 
+from columnar import metric_of
 from schemas.funds import TimeSeriesModel
 from scrapper_models import FundTS
 from settings import Settings, logger
+from archive_files import merge_rows
+from redis.archive import ParquetArchive, aggregate
+from ts_writer import COMPACTIONS, MONTH, TimeSeriesWriter, compacted_key, series_labels
 
 settings = Settings()
 
@@ -47,6 +52,49 @@ class Keys:
     def owners_ts(self, document: str) -> str:
         return f'{self.prefix}owners_{document}'
 
+    def job_key(self, fund_pk: str, month_year: str) -> str:
+        return f'{self.prefix}job_{fund_pk}_{month_year}'
+
+    def done_months(self, fund_pk: str) -> str:
+        return f'{self.prefix}done_{fund_pk}'
+
+    def resolution_keys(self, document: str, resolution: str) -> List[str]:
+        """Series read for a chart resolution: daily quotes, or their compacted companions."""
+        if resolution == "weekly":
+            return [compacted_key(self.value_ts(document), "1w", "last")]
+        if resolution == "monthly":
+            return [
+                compacted_key(self.value_ts(document), "1m", "last"),
+                compacted_key(self.value_ts(document), "1m", "min"),
+                compacted_key(self.value_ts(document), "1m", "max"),
+                compacted_key(self.net_worth_ts(document), "1m", "avg")
+            ]
+        return self.timeseries_keys(document)
+
+    def comparison(self, digest: str) -> str:
+        return f'{self.prefix}compare_{digest}'
+
+    def logret_ts(self, document: str) -> str:
+        return f'{self.prefix}logret_{document}'
+
+    def cumidx_ts(self, document: str) -> str:
+        return f'{self.prefix}cumidx_{document}'
+
+    def scrape_job(self, job_id: str) -> str:
+        return f'{self.prefix}scrapejob_{job_id}'
+
+    def scrape_job_months(self, job_id: str) -> str:
+        return f'{self.prefix}scrapejob_{job_id}_months'
+
+    def scrape_job_events(self, job_id: str) -> str:
+        return f'{self.prefix}scrapejob_{job_id}_events'
+
+    def month_watchers(self, fund_pk: str, month_year: str) -> str:
+        return f'{self.prefix}watch_{fund_pk}_{month_year}'
+
+    def archived(self, document: str) -> str:
+        return f'{self.prefix}archived_{document}'
+
     def timeseries_keys(self, document: str) -> List[str]:
         keys_list = [
             self.value_ts(document),
@@ -56,15 +104,45 @@ class Keys:
         return keys_list
 
 
+def create_pool() -> redis.ConnectionPool:
+    """Application wide connection pool, created on startup and shared by every request."""
+    return redis.ConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        max_connections=settings.redis_max_connections,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+        decode_responses=True,
+        encoding="utf-8"
+    )
+
+
+def pool_stats(pool: redis.ConnectionPool) -> dict:
+    return {
+        "max_connections": pool.max_connections,
+        "created": pool._created_connections,
+        "in_use": len(pool._in_use_connections),
+        "available": len(pool._available_connections),
+    }
+
+
 class RedisConnector:
-    def __init__(self):
+    def __init__(self, pool: Optional[redis.ConnectionPool] = None, created_series: Optional[Set[str]] = None):
         self.logger = logger
-        self.redis = redis.Redis(
-            host=settings.redis_host,
-            port=settings.redis_port,
-            decode_responses=True,
-            encoding="utf-8"
+        if pool is not None:
+            self.redis = redis.Redis(connection_pool=pool)
+        else:
+            self.redis = redis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                decode_responses=True,
+                encoding="utf-8"
+            )
+        self.writer = TimeSeriesWriter(
+            self.redis, duplicate_policy="first", chunk_size=settings.madd_batch_size, created=created_series
         )
+        self.archive = ParquetArchive()
 
     async def is_redis_available(self):
         # ... get redis connection here, or pass it in. up to you.
@@ -104,9 +182,14 @@ class RedisConnector:
 
     def convert_date(self, given_date) -> int:
         if isinstance(given_date, str):
-            return self.str_2_timestamp(given_date)
+            return int(self.str_2_timestamp(given_date))
         else:
-            return given_date.timestamp()
+            return int(given_date.timestamp())
+
+    def date_range(self, from_date=None, to_date=None) -> Tuple:
+        from_date = self.convert_date(from_date) if from_date is not None else 0
+        to_date = self.convert_date(to_date) if to_date is not None else "+"
+        return from_date, to_date
 
     async def get_timeseries(self, key: str, from_date, to_date):
         cached_ts = await self.redis.execute_command(
@@ -120,32 +203,305 @@ class RedisConnector:
         else:
             return None
 
+    @staticmethod
+    def archived_document(key: str) -> Optional[str]:
+        """Document of a value/owners/net worth series, daily or compacted, the ones with archived history."""
+        labels = series_labels(key)
+        if labels["metric"] in ("value", "owners", "networth") and labels["document"]:
+            return labels["document"]
+        return None
+
+    @staticmethod
+    def merge_tiers(
+            key: str, samples: Optional[list], archived: Dict[str, list], watermark: int, from_date, to_date
+    ) -> list:
+        """
+        Archived samples of `key` before the watermark followed by its Redis samples from then on.
+        Compacted series get the buckets of the archived days computed like their TS.CREATERULE does,
+        the bucket holding the watermark comes from Redis.
+        """
+        labels = series_labels(key)
+        daily = archived[labels["metric"]]
+        if "resolution" not in labels:
+            cold = daily if to_date == "+" else [sample for sample in daily if sample[0] <= to_date]
+            return cold + [sample for sample in samples or () if int(sample[0]) >= watermark]
+        bucket = next(
+            bucket for resolution, aggregation, bucket in COMPACTIONS[labels["metric"]]
+            if (resolution, aggregation) == (labels["resolution"], labels["aggregation"])
+        )
+        boundary = watermark - watermark % bucket
+        cold = [
+            sample for sample in aggregate(daily, bucket, labels["aggregation"])
+            if from_date <= sample[0] < boundary and (to_date == "+" or sample[0] <= to_date)
+        ]
+        return cold + [sample for sample in samples or () if int(sample[0]) >= boundary]
+
+    async def merge_archive(
+            self, cached: Dict[str, Optional[list]], watermarks: Dict[str, Optional[str]], from_date, to_date
+    ) -> Dict[str, Optional[list]]:
+        """
+        Samples of the series in `cached` before each fund watermark (PRICER_archived_<doc>) read from
+        the Parquet archive instead. Redis keeps some months before the watermark until their retention
+        drops them, those are left out so no quote is returned twice.
+        """
+        for document, watermark in watermarks.items():
+            if watermark is None or from_date >= int(watermark):
+                continue
+            watermark = int(watermark)
+            keys = [key for key in cached if self.archived_document(key) == document]
+            # the last bucket of a compacted series covers days after `to_date`
+            margin = MONTH if any("resolution" in series_labels(key) for key in keys) else 0
+            archive_to = watermark - 1 if to_date == "+" else min(to_date + margin, watermark - 1)
+            archived = await asyncio.to_thread(self.archive.read, document, from_date, archive_to)
+            for key in keys:
+                cached[key] = self.merge_tiers(key, cached[key], archived, watermark, from_date, to_date) or None
+        return cached
+
     async def get_cached_timeseries(
             self, key_list: list, from_date: str | datetime.datetime = None, to_date: str | datetime.datetime = None
     ):
         """
-        Add many samples to several timeseries keys.
-        `key_pairs` is an iterable of tuples containing in the 0th position the
-        timestamp key into which to insert entries and the 1th position the name
-        of the key within th `data` dict to find the sample.
+        TS.RANGE of every key in `key_list`, sent in one pipelined round trip with the archive watermarks
+        of their funds. Returns a dict key -> samples, None for missing or empty keys.
         """
-
-        from_date = self.convert_date(from_date) if from_date is not None else 0
-        to_date = self.convert_date(to_date) if to_date is not None else "+"
-        ts_cached = {}
+        from_date, to_date = self.date_range(from_date, to_date)
+        documents = list(dict.fromkeys(filter(None, map(self.archived_document, key_list))))
+        pipe = self.redis.pipeline(transaction=False)
         for key in key_list:
-            try:
-                ts_cached[key] = await self.get_timeseries(key, from_date, to_date)
-            except ResponseError:
+            pipe.execute_command('TS.RANGE', key, from_date, to_date)
+        for document in documents:
+            pipe.get(Keys().archived(document))
+        results = await pipe.execute(raise_on_error=False)
+        ts_cached = {}
+        for key, result in zip(key_list, results):
+            if isinstance(result, ResponseError):
                 self.logger.debug(f'Cached key {key} returning None')
-                ts_cached[key] = None
+                result = None
+            ts_cached[key] = result or None
+        watermarks = dict(zip(documents, results[len(key_list):]))
+        return await self.merge_archive(ts_cached, watermarks, from_date, to_date)
+
+    @staticmethod
+    def label_filter(label: str, values: List[str]) -> str:
+        return f"{label}=({','.join(values)})" if len(values) > 1 else f"{label}={values[0]}"
+
+    async def get_documents_timeseries(
+            self,
+            documents: List[str],
+            from_date: str | datetime.datetime = None,
+            to_date: str | datetime.datetime = None,
+            metrics: List[str] = ("value", "owners", "networth")
+    ) -> Dict[str, dict]:
+        """
+        Daily `metrics` series of many funds with a single TS.MRANGE filtered by the document label.
+        Returns a dict document -> {key: samples} keyed in `Keys().timeseries_keys` order,
+        archived history included.
+        """
+        from_date, to_date = self.date_range(from_date, to_date)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.execute_command(
+            'TS.MRANGE', from_date, to_date, 'FILTER',
+            self.label_filter("document", documents), self.label_filter("metric", list(metrics)), 'resolution='
+        )
+        pipe.mget([Keys().archived(document) for document in documents])
+        reply, watermarks = await pipe.execute()
+        cached = {
+            document: {key: None for key in Keys().timeseries_keys(document) if metric_of(key) in metrics}
+            for document in documents
+        }
+        for key, _labels, samples in reply:
+            _metric, _, document = key[len(Keys().prefix):].partition("_")
+            if key in cached.get(document, {}):
+                cached[document][key] = samples or None
+        for document, watermark in zip(documents, watermarks):
+            await self.merge_archive(cached[document], {document: watermark}, from_date, to_date)
+        return cached
+
+    async def get_last_timestamps(self, documents: List[str], metric: str = "value") -> Dict[str, Optional[int]]:
+        """Timestamp of the last daily sample of each fund, a single TS.MGET."""
+        reply = await self.redis.execute_command(
+            'TS.MGET', 'FILTER', self.label_filter("document", documents), f'metric={metric}', 'resolution='
+        )
+        last = dict.fromkeys(documents)
+        for key, _labels, sample in reply:
+            _metric, _, document = key[len(Keys().prefix):].partition("_")
+            if document in last and sample:
+                last[document] = int(sample[0])
+        return last
+
+    async def get_fund_timeseries(
+            self, document: str, from_date: str | datetime.datetime = None, to_date: str | datetime.datetime = None
+    ) -> dict:
+        """All the series of a fund in one round trip, see `get_documents_timeseries`."""
+        try:
+            cached = (await self.get_documents_timeseries([document], from_date, to_date))[document]
+        except ResponseError as e:
+            self.logger.debug(f'TS.MRANGE failed for {document}: {e}')
+            cached = {}
+        if not any(cached.values()):
+            # series written before they were labeled
+            cached = await self.get_cached_timeseries(Keys().timeseries_keys(document), from_date, to_date)
+        return cached
+
+    async def iter_fund_timeseries(
+            self,
+            document: str,
+            from_date: str | datetime.datetime = None,
+            to_date: str | datetime.datetime = None,
+            page_size: int = None
+    ) -> AsyncIterator[dict]:
+        """
+        Series of a fund in pages of `page_size` quotes, as {key: samples} dicts.
+        Archived history comes first, a year file at a time. Then each page is a TS.RANGE ... COUNT on the
+        value series followed by the owners and net worth samples of the same window in one pipelined
+        round trip, so memory is bounded by the page size.
+        """
+        value_key, owners_key, networth_key = Keys().timeseries_keys(document)
+        from_date, to_date = self.date_range(from_date, to_date)
+        page_size = page_size if page_size is not None else settings.stream_page_size
+        watermark = await self.redis.get(Keys().archived(document))
+        if watermark is not None and from_date < int(watermark):
+            watermark = int(watermark)
+            archive_to = watermark - 1 if to_date == "+" else min(to_date, watermark - 1)
+            years = self.archive.iter_years(document, from_date, archive_to)
+            while (year := await asyncio.to_thread(next, years, None)) is not None:
+                for start in range(0, len(year["value"]), page_size):
+                    page = year["value"][start:start + page_size]
+                    first, last = page[0][0], page[-1][0]
+                    yield {
+                        key: [sample for sample in year[metric_of(key)] if first <= sample[0] <= last] or None
+                        for key in (value_key, owners_key, networth_key)
+                    }
+            from_date = watermark
+            if to_date != "+" and from_date > to_date:
+                return
+        while True:
+            try:
+                page = await self.redis.execute_command('TS.RANGE', value_key, from_date, to_date, 'COUNT', page_size)
+            except ResponseError as e:
+                self.logger.debug(f'Cached key {value_key} returning None: {e}')
+                return
+            if not page:
+                return
+            first, last = int(page[0][0]), int(page[-1][0])
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.execute_command('TS.RANGE', owners_key, first, last)
+            pipe.execute_command('TS.RANGE', networth_key, first, last)
+            owners, net_worth = [
+                None if isinstance(result, ResponseError) else result
+                for result in await pipe.execute(raise_on_error=False)
+            ]
+            yield {value_key: page, owners_key: owners, networth_key: net_worth}
+            if len(page) < page_size:
+                return
+            from_date = last + 1
+
+    async def get_analytics_series(self, document: str, from_ts: int, to_ts: int) -> dict:
+        """
+        Derived series of a window in one pipelined round trip, never the whole history:
+        the cumulative index point at or before `from_ts`, the cumulative index and log returns inside the window,
+        and the CDI cumulative index at or before both bounds.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.execute_command('TS.REVRANGE', Keys().cumidx_ts(document), '-', from_ts, 'COUNT', 1)
+        pipe.execute_command('TS.RANGE', Keys().cumidx_ts(document), from_ts, to_ts)
+        pipe.execute_command('TS.RANGE', Keys().logret_ts(document), from_ts, to_ts)
+        pipe.execute_command('TS.REVRANGE', Keys().cumidx_ts("CDI"), '-', from_ts, 'COUNT', 1)
+        pipe.execute_command('TS.REVRANGE', Keys().cumidx_ts("CDI"), '-', to_ts, 'COUNT', 1)
+        pipe.get(Keys().archived(document))
+        *replies, watermark = await pipe.execute(raise_on_error=False)
+        replies = [None if isinstance(reply, ResponseError) or not reply else reply for reply in replies]
+        anchor, index, returns, cdi_start, cdi_end = replies
+        anchor = anchor[0] if anchor else None
+        if isinstance(watermark, str) and from_ts < int(watermark):
+            anchor, index, returns = await self.archived_analytics_series(
+                document, from_ts, to_ts, int(watermark), index, returns
+            )
+        return {
+            "anchor": anchor,
+            "index_samples": index,
+            "return_samples": returns,
+            "cdi_start": cdi_start[0] if cdi_start else None,
+            "cdi_end": cdi_end[0] if cdi_end else None,
+        }
+
+    async def archived_analytics_series(
+            self,
+            document: str,
+            from_ts: int,
+            to_ts: int,
+            watermark: int,
+            index: Optional[list],
+            returns: Optional[list]
+    ) -> Tuple[Optional[list], Optional[list], Optional[list]]:
+        """
+        Derived series of the archived days recomputed from the archived quotes, the cumulative index is ln(value)
+        and the log return the difference of consecutive ones. Redis samples are kept from the watermark on.
+        """
+        def read():
+            anchor = self.archive.last_on_or_before(document, from_ts)
+            quotes = self.archive.read(document, from_ts, min(to_ts, watermark - 1))["value"]
+            return anchor, quotes
+
+        anchor, quotes = await asyncio.to_thread(read)
+        points = [(int(timestamp), float(value)) for timestamp, value in quotes if float(value) > 0]
+        previous = (int(anchor[0]), float(anchor[1])) if anchor is not None and float(anchor[1]) > 0 else None
+        cold_index, cold_returns = [], []
+        for timestamp, value in points:
+            cold_index.append([timestamp, math.log(value)])
+            if previous is not None and previous[0] < timestamp:
+                cold_returns.append([timestamp, math.log(value / previous[1])])
+            previous = timestamp, value
+        index = cold_index + [sample for sample in index or () if int(sample[0]) >= watermark]
+        returns = cold_returns + [sample for sample in returns or () if int(sample[0]) >= watermark]
+        anchor = [anchor[0], math.log(float(anchor[1]))] if anchor is not None and float(anchor[1]) > 0 else None
+        return anchor, index or None, returns or None
+
+    async def get_last_quote(
+            self, document: str, on_or_before: str | datetime.datetime
+    ) -> Optional[Tuple[int, str]]:
+        """
+        (timestamp, value) of the last quote at or before `on_or_before`, a single TS.REVRANGE ... COUNT 1,
+        or the archive when Redis has no quote that old anymore.
+        """
+        key = Keys().value_ts(document)
+        timestamp = self.convert_date(on_or_before)
+        try:
+            reply = await self.redis.execute_command('TS.REVRANGE', key, '-', timestamp, 'COUNT', 1)
+        except ResponseError as e:
+            self.logger.debug(f'Cached key {key} returning None: {e}')
+            return None
+        if not reply:
+            return await asyncio.to_thread(self.archive.last_on_or_before, document, timestamp)
+        timestamp, value = reply[0]
+        return int(timestamp), value
+
+    async def get_last_quotes(self, lookups: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Optional[Tuple[int, str]]]:
+        """`get_last_quote` of many (document, timestamp) pairs in one pipelined round trip."""
+        lookups = list(dict.fromkeys(lookups))
+        pipe = self.redis.pipeline(transaction=False)
+        for document, timestamp in lookups:
+            pipe.execute_command('TS.REVRANGE', Keys().value_ts(document), '-', timestamp, 'COUNT', 1)
+        quotes, archived = {}, []
+        for lookup, reply in zip(lookups, await pipe.execute(raise_on_error=False)):
+            if isinstance(reply, ResponseError):
+                quotes[lookup] = None
+            elif not reply:
+                archived.append(lookup)
+            else:
+                quotes[lookup] = int(reply[0][0]), reply[0][1]
+        if archived:
+            found = await asyncio.to_thread(
+                lambda: [self.archive.last_on_or_before(document, timestamp) for document, timestamp in archived]
+            )
+            quotes.update(zip(archived, found))
+        return quotes
 
-        # threads = [Thread(target=self.get_timeseries, args=(key, from_date, to_date)) for key in key_list]
-        # for thread in threads:
-        #     thread.start()
-        #     thread.join()
+    async def get_comparison(self, digest: str) -> Optional[str]:
+        return await self.redis.get(Keys().comparison(digest))
 
-        return ts_cached
+    async def set_comparison(self, digest: str, body: str):
+        await self.redis.set(Keys().comparison(digest), body, ex=settings.compare_cache_ttl)
 
     async def get_cached_model(self, document: str) -> Optional[dict]:
         key = Keys().fund_key(document)
@@ -163,12 +519,101 @@ class RedisConnector:
             json.dumps(dataclasses.asdict(data), separators=(",", ":"), cls=EnhancedJSONEncoder)
 
         )
+        await self.invalidate(data.document)
+
+    async def invalidate(self, document: str):
+        """Drop the in-process copy of the fund on every API replica."""
+        await self.redis.publish(settings.invalidation_channel, document)
+
+    async def claim_months(self, fund_pk: str, months: List[str], token: str) -> List[str]:
+        """Months not complete nor already in flight, claimed in flight for `token` until JOB_TTL."""
+        done = await self.redis.smembers(Keys().done_months(fund_pk))
+        months = [month for month in months if month not in done]
+        if not months:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for month in months:
+            pipe.set(Keys().job_key(fund_pk, month), token, nx=True, ex=settings.job_ttl)
+        claimed = await pipe.execute()
+        return [month for month, ok in zip(months, claimed) if ok]
+
+    async def create_job(self, job_id: str, document: str):
+        key = Keys().scrape_job(job_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping={
+            "document": document,
+            "status": "pending",
+            "created_at": datetime.datetime.now().isoformat()
+        })
+        pipe.expire(key, settings.scrape_job_ttl)
+        await pipe.execute()
+
+    async def update_job(self, job_id: str, **fields):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(Keys().scrape_job(job_id), mapping={name: str(value) for name, value in fields.items()})
+        pipe.publish(Keys().scrape_job_events(job_id), json.dumps(fields, cls=EnhancedJSONEncoder))
+        await pipe.execute()
+
+    async def watch_months(self, job_id: str, fund_pk: str, months: List[str]):
+        """
+        Track `months` on the job: workers report done/failed to every job watching a month.
+        Watchers are registered before reading the done set, so a month completed meanwhile is never missed.
+        """
+        months_key = Keys().scrape_job_months(job_id)
+        pipe = self.redis.pipeline(transaction=False)
+        for month in months:
+            pipe.sadd(Keys().month_watchers(fund_pk, month), job_id)
+            pipe.expire(Keys().month_watchers(fund_pk, month), settings.scrape_job_ttl)
+        pipe.hset(months_key, mapping=dict.fromkeys(months, "queued"))
+        pipe.expire(months_key, settings.scrape_job_ttl)
+        await pipe.execute()
+        done = await self.redis.smembers(Keys().done_months(fund_pk))
+        already_done = [month for month in months if month in done]
+        if already_done:
+            await self.redis.hset(months_key, mapping=dict.fromkeys(already_done, "done"))
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        """Job status with its months by state, `running` until no month is queued anymore."""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(Keys().scrape_job(job_id))
+        pipe.hgetall(Keys().scrape_job_months(job_id))
+        job, months = await pipe.execute()
+        if not job:
+            return None
+        by_state = {"queued": [], "done": [], "failed": []}
+        for month, state in months.items():
+            by_state.setdefault(state, []).append(month)
+        status = job["status"]
+        if status == "published":
+            status = "running" if by_state["queued"] else "failed" if by_state["failed"] else "done"
+        return dict(job, job_id=job_id, status=status, months=by_state)
+
+    async def job_events(self, job_id: str, timeout: float) -> AsyncIterator[Optional[dict]]:
+        """
+        Progress events published for the job. Yields None once subscribed and then
+        every `timeout` seconds without events. Holds a dedicated pool connection while iterated.
+        """
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(Keys().scrape_job_events(job_id))
+        try:
+            yield None
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+                yield json.loads(message["data"]) if message else None
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.reset()
 
     async def publish(self, msg):
         try:
-            await self.redis.publish(settings.fund_channel, json.dumps(msg))
+            await self.redis.xadd(
+                settings.fund_stream,
+                {"data": json.dumps(msg)},
+                maxlen=settings.stream_maxlen,
+                approximate=True
+            )
         except (ResponseError, TimeoutError, ConnectionError):
-            self.logger.error(f"Error while publishing: {msg.message_id}")
+            self.logger.error(f"Error while publishing: {msg['message_id']}")
             pass
 
     async def add_many_to_timeseries(
@@ -180,48 +625,49 @@ class RedisConnector:
         timestamp key into which to insert entries and the 1th position the name
         of the key within th `data` dict to find the sample.
         """
-        partial = functools.partial(self.redis.execute_command, 'TS.MADD')
-        for entry in data:
-            for timeseries_key, attr in key_value_pairs:
-                point = entry.__getattribute__(attr)
-                v = str(point.quantize(Decimal("1.000000000"))) if isinstance(point, Decimal) else point
-                partial = functools.partial(
-                    partial,
-                    timeseries_key,
-                    int(entry.timestamp.timestamp()),
-                    v
-                )
-        return await partial()
-
-    async def create_ts(self, key):
-        try:
-            await self.redis.execute_command(
-                'TS.CREATE', key,
-                'DUPLICATE_POLICY', 'first',
-            )
-        except ResponseError as e:
-            # Time series probably already exists
-            logger.info('Could not create timeseries %s, error: %s', key, e)
+        return await self.writer.write_entries(key_value_pairs, data)
 
-    async def check_ts_by_key(self, key: str):
-        cached = await self.redis.get(key)
-        if cached:
-            return True
-        else:
-            return False
+    async def check_ts_by_key(self, key: str) -> bool:
+        return bool(await self.redis.exists(key))
 
     async def create_ts_key(self, key_list):
-        for key in key_list:
-            existing = await self.check_ts_by_key(key)
-            if not existing:
-                self.logger.info("Time series not found, will be created!")
-                await self.create_ts(key)
+        await self.writer.ensure_series(key_list)
+
+    async def archive_late(self, document: str, data: list[TimeSeriesModel]) -> list[TimeSeriesModel]:
+        """
+        Entries of days before the fund watermark (PRICER_archived_<doc>) are merged into its Parquet files,
+        Redis rejects them past the RETENTION. Returns the entries left for Redis.
+        """
+        watermark = await self.redis.get(Keys().archived(document))
+        if watermark is None:
+            return data
+        watermark = int(watermark)
+        hot, rows = [], {}
+        for entry in data:
+            timestamp = int(entry.timestamp.timestamp())
+            if timestamp >= watermark:
+                hot.append(entry)
+                continue
+            rows[timestamp] = {
+                "timestamp": timestamp,
+                "value": float(entry.value),
+                "owners": int(entry.owners) if entry.owners is not None else None,
+                "net_worth": float(entry.net_worth) if entry.net_worth is not None else None,
+            }
+        if rows:
+            await asyncio.to_thread(merge_rows, self.archive.root, document, rows)
+            self.logger.info(f"Wrote {len(rows)} late quotes of {document} to the archive")
+        return hot
 
     async def persist_timeseries(self, document: str, data: list[TimeSeriesModel]):
         doc_number = document
         value_key = Keys().value_ts(doc_number)
         owner_key = Keys().owners_ts(doc_number)
         networth_key = Keys().net_worth_ts(doc_number)
+        data = await self.archive_late(doc_number, data)
+        if not data:
+            await self.invalidate(doc_number)
+            return
         await self.create_ts_key([value_key, owner_key, networth_key])
         try:
             await self.add_many_to_timeseries(
@@ -234,3 +680,4 @@ class RedisConnector:
             )
         except ResponseError as e:
             logger.info('Error while writing data series for document: %s', doc_number)
+        await self.invalidate(doc_number)
@@ -1,5 +1,6 @@
 import datetime
 from decimal import Decimal
+from enum import Enum
 from typing import Optional, List
 
 from pydantic import BaseModel
@@ -8,11 +9,55 @@ from pydantic import BaseModel
 class ResponseQuote(BaseModel):
     document: str
     date: datetime.datetime
+    quote_date: datetime.datetime
     investment: Decimal
     quote_vale_on_date: Decimal
     number_of_quotes: Decimal
 
 
+class Resolution(str, Enum):
+    daily = "daily"
+    weekly = "weekly"
+    monthly = "monthly"
+
+
+class Position(BaseModel):
+    document: str
+    date: str  # dd/mm/yyyy
+    investment: Decimal
+
+
+class RequestPortfolio(BaseModel):
+    positions: List[Position]
+    valuation_date: Optional[str]  # dd/mm/yyyy
+
+
+class PositionValuation(BaseModel):
+    document: str
+    date: Optional[datetime.datetime]
+    investment: Decimal
+    quote_date: Optional[datetime.datetime]
+    quote_value: Optional[Decimal]
+    number_of_quotes: Optional[Decimal]
+    valuation_quote_date: Optional[datetime.datetime]
+    valuation_quote_value: Optional[Decimal]
+    value: Optional[Decimal]
+    error: Optional[str]
+
+
+class ResponsePortfolio(BaseModel):
+    valuation_date: Optional[datetime.datetime]
+    total_investment: Decimal
+    total_value: Optional[Decimal]
+    positions: List[PositionValuation]
+
+
+class RequestCompare(BaseModel):
+    documents: List[str]
+    from_date: Optional[str]  # dd/mm/yyyy
+    to_date: Optional[str]  # dd/mm/yyyy
+
+
 class RequestQuery(BaseModel):
     document: str
     from_date: Optional[str]
@@ -52,3 +97,15 @@ class StreamingSchema(BaseModel):
     document: str
     fund_id: Optional[str]
     timeseries: Optional[List[TimeSeriesModel]]
+
+
+class ResponseAnalytics(BaseModel):
+    document: str
+    from_date: Optional[datetime.datetime]
+    to_date: Optional[datetime.datetime]
+    period_return: Optional[float]
+    annualized_volatility: Optional[float]
+    max_drawdown: Optional[float]
+    cdi_return: Optional[float]
+    excess_return: Optional[float]
+    percent_of_cdi: Optional[float]
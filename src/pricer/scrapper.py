@@ -1,8 +1,9 @@
+import asyncio
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import date, datetime
-from decimal import Decimal
-from time import sleep
 from typing import List, Tuple, Union
 from uuid import uuid4
 
@@ -16,14 +17,26 @@ from selenium.webdriver.support.ui import WebDriverWait  # type: ignore
 from redis.connector import RedisConnector
 from scrapper_models import TimeSeries, FundTS
 from settings import Settings
+from table_parser import parse_daily_table
 
 settings = Settings()
 thread_local = threading.local()
+# Selenium calls block, they run on dedicated threads so the API event loop keeps serving requests.
+browser_executor = ThreadPoolExecutor(max_workers=settings.browser_workers, thread_name_prefix="webdriver")
+
+
+async def run_blocking(func, *args, timeout: float = None):
+    """Run a blocking browser call on `browser_executor`, raising asyncio.TimeoutError after `timeout` seconds."""
+    loop = asyncio.get_running_loop()
+    timeout = timeout if timeout is not None else settings.browser_timeout
+    return await asyncio.wait_for(loop.run_in_executor(browser_executor, func, *args), timeout)
 
 
 class Scrapper:
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, redis: RedisConnector = None, job_id: str = None):
         self.fund_ts_model = FundTS()
+        self.redis = redis
+        self.job_id = job_id
         self.logger = logger if logger is not None else logging.getLogger(__name__)
         chrome_options = webdriver.ChromeOptions()
         chrome_options.add_argument("--headless")
@@ -33,7 +46,22 @@ class Scrapper:
         chrome_options.experimental_options["prefs"] = chrome_prefs
         chrome_prefs["profile.default_content_settings"] = {"images": 2}  # disable image
         self.chrome_options = chrome_options
-        
+
+    def new_driver(self) -> Chrome:
+        return webdriver.Chrome('chromedriver', options=self.chrome_options)
+
+    @asynccontextmanager
+    async def browser(self):
+        wd = await run_blocking(self.new_driver)
+        self.logger.debug("Success started webdriver")
+        try:
+            yield wd
+        finally:
+            try:
+                await run_blocking(wd.quit)
+            except Exception as e:
+                self.logger.error(f"Error while closing webdriver: {e}")
+
     def get_fund_pk(self, url_str: str) -> str:
         find_str = "?PK_PARTIC="
         pk_position = url_str.find(find_str)
@@ -56,51 +84,55 @@ class Scrapper:
                                    datetime.strptime(f'01/{date_str}', "%d/%m/%Y").date() <= end_date]
         return available_date_list
 
+    @staticmethod
+    def select_month(wd: Chrome, i: int, month_year: str) -> str:
+        """Blocking: select the i-th ddComptc option and return the page source once the grid is reloaded."""
+        previous_table = wd.find_elements(By.ID, "dgDocDiario")
+        wd.find_element(By.XPATH, f"//*[@id='ddComptc']/option[{i}]").click()
+        # this will click the option which index is defined by position
+        if previous_table:
+            WebDriverWait(wd, 20).until(EC.staleness_of(previous_table[0]))
+        WebDriverWait(wd, 20).until(EC.presence_of_element_located((By.XPATH, '//*[@id="dgDocDiario"]')))
+        return wd.page_source
+
     async def parse_data(self, wd, i=None, month_year=None):
         if isinstance(wd, tuple):
             i = wd[1]
             month_year = wd[2]
             wd = wd[0]
         self.logger.debug(f"Parsing {month_year}")
-        i += 1
-        wd.find_element(By.XPATH, f"//*[@id='ddComptc']/option[{i}]").click()
-        # this will click the option which index is defined by position
-        sleep(3)
-        WebDriverWait(wd, 20).until(EC.presence_of_element_located((By.XPATH, '//*[@id="dgDocDiario"]')))
-        rows = wd.find_elements(By.XPATH, '//*[@id="dgDocDiario"]/tbody/tr')
-        timeseries_list = []
-        for row in rows[1:]:  # linha 0 header da tabela
-            daily_data = [field.replace(" ", "") for field in row.text.split(" ")]
-            value = daily_data[1]
-            date_field = daily_data[0]
-            if value != "":
-                try:
-                    net_worth = daily_data[4]
-                    owner_number = daily_data[6]
-                    datetime_stamp = datetime.strptime(f'{date_field}/{month_year}', "%d/%m/%Y")
-                    timeseries = TimeSeries(
-                        timestamp=datetime_stamp,
-                        value=Decimal(value.replace(",", ".")),
-                        net_worth_str=net_worth,
-                        owners=int(owner_number)
-                    )
-                    timeseries_list.append(timeseries)
-                except ValueError as e:
-                    self.logger.error(e)
-                    self.logger.error(date_field, month_year)
-        return timeseries_list
-
-    async def publish_to_parse(self, month_year):
-        redis = RedisConnector()
+        page_source = await run_blocking(self.select_month, wd, i + 1, month_year)
+        # one page_source transfer instead of a WebDriver round trip per row
+        return parse_daily_table(page_source, month_year)
+
+    async def publish_to_parse(self, months: List[str]):
+        redis = self.redis if self.redis is not None else RedisConnector()
+        message_id = str(uuid4())
+        if self.job_id is not None:
+            await redis.watch_months(self.job_id, self.fund_ts_model.fund_pk, months)
+        months = await redis.claim_months(self.fund_ts_model.fund_pk, months, message_id)
+        if not months:
+            self.logger.debug("Months already complete or in flight, nothing to publish")
+            return
         msg = {
             "document": self.fund_ts_model.document,
             "fund_pk": self.fund_ts_model.fund_pk,
-            "month_year": month_year,
-            "message_id": str(uuid4()),
+            "month_year": months[0],
+            "months": months,
+            "message_id": message_id,
+            "job_id": self.job_id,
             "acked": False
         }
         await redis.publish(msg)
-        self.logger.info(f"Published {month_year} to pubsub")
+        self.logger.info(f"Published {len(months)} months ({months[0]} to {months[-1]}) to pubsub")
+
+    @staticmethod
+    def list_months(wd: Chrome, link: str) -> List[str]:
+        """Blocking: load the fund daily page and return the months available on ddComptc."""
+        wd.get(link)
+        selectors = wd.find_element(By.XPATH, '//*[@id="ddComptc"]')
+        selectors_list = selectors.text.split("\n")
+        return [i.replace(' ', "") for i in selectors_list[:-1]]
 
     async def parse_table(
             self,
@@ -109,17 +141,8 @@ class Scrapper:
             from_date: Union[date, None] = None,
             end_date: Union[date, None] = None
     ) -> List[TimeSeries]:
-        wd.get(link)
-        # table = wd.find_element(By.ID, 'TABLE1')
-        selectors = wd.find_element(By.XPATH, '//*[@id="ddComptc"]')
-        selectors_list = selectors.text.split("\n")
-        selectors_list = [i.replace(' ', "") for i in selectors_list[:-1]]
+        selectors_list = await run_blocking(self.list_months, wd, link)
         selectors_filtered = self.filter_limit_date(selectors_list, from_date, end_date)
-        select = wd.find_element(By.XPATH, '//*[@id="ddComptc"]')
-        wd.execute_script(
-            "showDropdown = function (element) {var event; event = document.createEvent('MouseEvents'); event.initMouseEvent('mousedown', true, true, window); element.dispatchEvent(event); }; showDropdown(arguments[0]);",
-            select)
-        # open dropdown options
         self.logger.debug(f"Found {len(selectors_filtered)} months to scrap")
         parsed_ts = []
         await self.publish_to_queue(selectors_filtered)
@@ -150,20 +173,25 @@ class Scrapper:
         return timeseries
 
     async def publish_to_queue(self, selectors_filtered):
-        from concurrent.futures import ThreadPoolExecutor, wait, as_completed
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            tasks = [executor.submit(self.publish_to_parse, month_year) for month_year in selectors_filtered]
-            # wait for all tasks to complete
-            wait(tasks)
-            for future in as_completed(tasks):
-                await future.result()
-            self.logger.debug(f"All messages published")
+        """One message per batch of months, the worker walks all of them on a single page load."""
+        batch_size = max(settings.batch_months, 1)
+        for start in range(0, len(selectors_filtered), batch_size):
+            await self.publish_to_parse(selectors_filtered[start:start + batch_size])
+        self.logger.debug(f"All messages published")
 
     async def get_funds_details(
             self,
             document_number: str,
             wd: Chrome
     ) -> str:
+        return await run_blocking(self.load_funds_details, document_number, wd)
+
+    def load_funds_details(
+            self,
+            document_number: str,
+            wd: Chrome
+    ) -> str:
+        """Blocking: open the CVM fund search, follow the first result and fill the fund model details."""
         wd.get(settings.cvm_url + document_number)  # url = CVM + CNPJ
         WebDriverWait(wd, 20).until(EC.element_to_be_clickable((By.CLASS_NAME, 'HRefPreto')))
         wd.execute_script("__doPostBack('ddlFundos$_ctl0$lnkbtn1','')")
@@ -187,7 +215,7 @@ class Scrapper:
         self.fund_ts_model.fund_pk = fund_id
         self.fund_ts_model.document = document
         from_date = datetime.fromisoformat(from_date) if isinstance(from_date, str) else None
-        with webdriver.Chrome('chromedriver', options=self.chrome_options) as wd:
+        async with self.browser() as wd:
             time_series: list = await self.parse_table(
                 wd=wd,
                 from_date=from_date,
@@ -215,8 +243,7 @@ class Scrapper:
         if end_date is not None:
             end_date = end_date if hasattr(end_date, "strftime") else self.str_2_date(end_date)
         # Detalhes do fundo
-        with webdriver.Chrome('chromedriver', options=self.chrome_options) as wd:
-            self.logger.debug("Success started webdriver")
+        async with self.browser() as wd:
             if document_number:
                 self.fund_ts_model.document = document_number
                 link = await self.get_funds_details(document_number, wd)
@@ -231,7 +258,6 @@ class Scrapper:
 
 
 if __name__ == "__main__":
-    import asyncio
     from time import perf_counter
 
     async def get_data():
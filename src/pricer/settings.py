@@ -11,7 +11,31 @@ class Settings(BaseSettings):
     redis_port: int = Field(env='REDIS_PORT', default=15000)
     debug: str = Field(env='DEBUG', default="False")
     log_level: str = "DEBUG" if debug else "INFO"
-    fund_channel: str = Field(env='REDIS_CHANNEL', defaul="fund_parser")
+    redis_max_connections: int = Field(env='REDIS_MAX_CONNECTIONS', default=50)
+    redis_socket_timeout: float = Field(env='REDIS_SOCKET_TIMEOUT', default=5.0)
+    redis_connect_timeout: float = Field(env='REDIS_CONNECT_TIMEOUT', default=2.0)
+    redis_health_check_interval: int = Field(env='REDIS_HEALTH_CHECK_INTERVAL', default=30)
+    fund_channel: str = Field(env='REDIS_CHANNEL', default="fund_parser")
+    fund_stream: str = Field(env='REDIS_STREAM', default="fund_parser_stream")
+    stream_maxlen: int = Field(env='REDIS_STREAM_MAXLEN', default=100000)
+    scraper_engine: str = Field(env='SCRAPER_ENGINE', default="selenium")  # selenium | http
+    http_timeout: float = Field(env='HTTP_TIMEOUT', default=30.0)
+    batch_months: int = Field(env='BATCH_MONTHS', default=12)
+    job_ttl: int = Field(env='JOB_TTL', default=1800)
+    madd_batch_size: int = Field(env='MADD_BATCH_SIZE', default=1000)
+    browser_workers: int = Field(env='BROWSER_WORKERS', default=2)
+    browser_timeout: float = Field(env='BROWSER_TIMEOUT', default=90.0)
+    stream_page_size: int = Field(env='STREAM_PAGE_SIZE', default=1000)
+    scrape_job_ttl: int = Field(env='SCRAPE_JOB_TTL', default=86400)
+    sse_heartbeat: float = Field(env='SSE_HEARTBEAT', default=15.0)
+    singleflight_lock_ttl: float = Field(env='SINGLEFLIGHT_LOCK_TTL', default=300.0)
+    singleflight_wait_timeout: float = Field(env='SINGLEFLIGHT_WAIT_TIMEOUT', default=300.0)
+    singleflight_poll_interval: float = Field(env='SINGLEFLIGHT_POLL_INTERVAL', default=0.5)
+    hot_cache_max_bytes: int = Field(env='HOT_CACHE_MAX_BYTES', default=256 * 1024 * 1024)
+    invalidation_channel: str = Field(env='REDIS_INVALIDATION_CHANNEL', default="PRICER_invalidate")
+    compare_max_funds: int = Field(env='COMPARE_MAX_FUNDS', default=100)
+    compare_cache_ttl: int = Field(env='COMPARE_CACHE_TTL', default=3600)
+    archive_dir: str = Field(env='ARCHIVE_DIR', default="/archive")
 
     class Config:
         env_file = find_dotenv(filename=".env", usecwd=True)
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from uuid import uuid4
+
+import aioredis as redis
+
+from settings import Settings, logger
+
+settings = Settings()
+
+T = TypeVar("T")
+
+# delete the lock only if it is still ours, it may have expired and been taken by another replica
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesce concurrent resolutions of the same key.
+
+    Callers of this process await one shared task. Across replicas the task leads only while holding
+    the Redis lock `<prefix><key>`; otherwise it waits for the lock to go away and asks `follower`
+    for the result the leading replica left in Redis, leading itself when there is none.
+    """
+
+    def __init__(
+            self,
+            prefix: str = "PRICER_lock_",
+            lock_ttl: float = None,
+            wait_timeout: float = None,
+            poll_interval: float = None
+    ):
+        self.logger = logger
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl if lock_ttl is not None else settings.singleflight_lock_ttl
+        self.wait_timeout = wait_timeout if wait_timeout is not None else settings.singleflight_wait_timeout
+        self.poll_interval = poll_interval if poll_interval is not None else settings.singleflight_poll_interval
+        self.flights: Dict[str, asyncio.Future] = {}
+
+    async def do(
+            self,
+            key: str,
+            leader: Callable[[], Awaitable[T]],
+            follower: Callable[[], Awaitable[Optional[T]]],
+            redis_client: redis.Redis
+    ) -> T:
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._resolve(key, leader, follower, redis_client))
+            self.flights[key] = flight
+            flight.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.logger.debug(f"Joining in-flight resolution of {key}")
+        # a cancelled caller must not cancel the resolution the others are waiting for
+        return await asyncio.shield(flight)
+
+    def _forget(self, key: str, flight: asyncio.Future):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def _resolve(self, key: str, leader, follower, redis_client: redis.Redis):
+        loop = asyncio.get_running_loop()
+        lock_key = f"{self.prefix}{key}"
+        token = str(uuid4())
+        deadline = loop.time() + self.wait_timeout
+        while True:
+            if await redis_client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                try:
+                    return await leader()
+                finally:
+                    await redis_client.eval(RELEASE_LOCK, 1, lock_key, token)
+            self.logger.debug(f"{key} is being resolved by another replica, waiting")
+            while await redis_client.exists(lock_key):
+                if loop.time() > deadline:
+                    raise asyncio.TimeoutError(f"Timeout waiting for {lock_key}")
+                await asyncio.sleep(self.poll_interval)
+            result = await follower()
+            if result is not None:
+                return result
+            # the other replica failed, try to lead
@@ -0,0 +1,68 @@
+import html
+import re
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List
+
+from scrapper_models import TimeSeries
+from settings import logger
+
+TABLE_RE = re.compile(r'<table\b[^>]*id="dgDocDiario"[^>]*>(.*?)</table>', re.IGNORECASE | re.DOTALL)
+ROW_RE = re.compile(r"<tr\b[^>]*>(.*?)</tr>", re.IGNORECASE | re.DOTALL)
+CELL_RE = re.compile(r"<td\b[^>]*>(.*?)</td>", re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r"<[^>]+>")
+
+# dgDocDiario: Dia | Quota | Captação | Resgate | Patrimônio Líquido | Total da Carteira | Nº Cotistas | ...
+COLUMNS = {"day": 0, "value": 1, "net_worth": 4, "owners": 6}
+MIN_CELLS = max(COLUMNS.values()) + 1
+
+
+def clean_cell(raw: str) -> str:
+    return html.unescape(TAG_RE.sub("", raw)).replace("\xa0", "").replace(" ", "").strip()
+
+
+def extract_daily_table(page_source: str) -> Dict[str, List[str]]:
+    """Extract the whole dgDocDiario grid from `page_source` in a single pass.
+
+    Returns one list of raw strings per column of `COLUMNS`, header and empty quote rows are skipped.
+    """
+    columns = {name: [] for name in COLUMNS}
+    table = TABLE_RE.search(page_source)
+    if table is None:
+        return columns
+    for row in ROW_RE.findall(table.group(1))[1:]:  # linha 0 header da tabela
+        cells = CELL_RE.findall(row)
+        if len(cells) < MIN_CELLS:
+            continue
+        value = clean_cell(cells[COLUMNS["value"]])
+        if value == "":
+            continue
+        columns["value"].append(value)
+        for name in ("day", "net_worth", "owners"):
+            columns[name].append(clean_cell(cells[COLUMNS[name]]))
+    return columns
+
+
+def columns_to_timeseries(columns: Dict[str, List[str]], month_year: str) -> List[TimeSeries]:
+    timeseries_list = []
+    for date_field, value, net_worth, owner_number in zip(
+            columns["day"], columns["value"], columns["net_worth"], columns["owners"]
+    ):
+        try:
+            timeseries_list.append(
+                TimeSeries(
+                    timestamp=datetime.strptime(f'{date_field}/{month_year}', "%d/%m/%Y"),
+                    value=Decimal(value.replace(",", ".")),
+                    net_worth_str=net_worth,
+                    owners=int(owner_number)
+                )
+            )
+        except ValueError as e:
+            logger.error(e)
+            logger.error(f"{date_field} {month_year}")
+    return timeseries_list
+
+
+def parse_daily_table(page_source: str, month_year: str) -> List[TimeSeries]:
+    return columns_to_timeseries(extract_daily_table(page_source), month_year)
+
@@ -0,0 +1,46 @@
+import json
+
+import pyarrow as pa
+
+from columnar import frame_from_cached
+from formats import columns, encode_arrow
+from redis.connector import Keys
+
+DOCUMENT = "18993924000100"
+MONTHS = [1672531200, 1675123200]
+
+
+def monthly_cached() -> dict:
+    keys = Keys().resolution_keys(DOCUMENT, "monthly")
+    samples = [
+        [[MONTHS[0], "1.5"], [MONTHS[1], "1.6"]],
+        [[MONTHS[0], "1.4"], [MONTHS[1], "1.5"]],
+        [[MONTHS[0], "1.7"], [MONTHS[1], "1.8"]],
+        [[MONTHS[0], "1000.0"]],
+    ]
+    return dict(zip(keys, samples))
+
+
+def test_monthly_frame_reads_low_high_series():
+    frame = frame_from_cached(monthly_cached())
+
+    assert frame.ranges == ("low", "high")
+    assert frame.value.tolist() == [1.5, 1.6]
+    assert frame.low.tolist() == [1.4, 1.5]
+    assert frame.high.tolist() == [1.7, 1.8]
+    assert columns(frame)["net_worth"] == [1000.0, None]
+    assert [record["high"] for record in frame.records()] == [1.7, 1.8]
+    assert frame.slice(MONTHS[1]).low.tolist() == [1.5]
+
+    table = pa.ipc.open_stream(encode_arrow({"document": DOCUMENT}, frame)).read_all()
+    assert table.column("low").to_pylist() == [1.4, 1.5]
+    assert json.loads(table.schema.metadata[b"fund"]) == {"document": DOCUMENT}
+
+
+def test_daily_frame_has_no_range_columns():
+    keys = Keys().timeseries_keys(DOCUMENT)
+    frame = frame_from_cached({keys[0]: [[MONTHS[0], "1.5"]]})
+
+    assert frame.ranges == ()
+    assert frame.low is None
+    assert "low" not in columns(frame)
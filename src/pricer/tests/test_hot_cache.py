@@ -0,0 +1,95 @@
+import asyncio
+
+from columnar import SeriesFrame
+from hot_cache import HotFundCache
+
+
+def test_concurrent_misses_share_one_load():
+    cache = HotFundCache(max_bytes=1 << 20, channel="test")
+    cache.listening = True
+    loads = []
+
+    async def loader(generation: int):
+        loads.append(generation)
+        await asyncio.sleep(0.05)
+        return cache.put("18993924000100", {"document": "18993924000100"}, SeriesFrame.empty(), generation)
+
+    async def misses():
+        return await asyncio.gather(*(cache.load("18993924000100", loader) for _ in range(10)))
+
+    results = asyncio.run(misses())
+
+    assert loads == [0]
+    assert all(result is results[0] for result in results)
+    assert cache.get("18993924000100") is results[0]
+    assert not cache.loading
+
+
+def test_miss_after_invalidation_does_not_join_older_load():
+    cache = HotFundCache(max_bytes=1 << 20, channel="test")
+    cache.listening = True
+    loads = []
+
+    async def loader(generation: int):
+        loads.append(generation)
+        await asyncio.sleep(0.05)
+        return cache.put("18993924000100", {"generation": generation}, SeriesFrame.empty(), generation)
+
+    async def misses():
+        first = asyncio.ensure_future(cache.load("18993924000100", loader))
+        await asyncio.sleep(0)
+        cache.invalidate("18993924000100")
+        return await asyncio.gather(first, cache.load("18993924000100", loader))
+
+    stale, fresh = asyncio.run(misses())
+
+    assert loads == [0, 1]
+    assert fresh.model == {"generation": 1}
+    # the load started before the invalidation is not stored
+    assert cache.get("18993924000100") is fresh
+
+
+class BrokenPubSub:
+    """Subscription whose first poll fails with an error that is not a Redis one."""
+
+    def __init__(self, client: "PubSubClient"):
+        self.client = client
+
+    async def subscribe(self, channel: str):
+        self.client.subscriptions += 1
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0):
+        if self.client.subscriptions == 1:
+            raise KeyError("data")
+        await asyncio.sleep(timeout)
+        return None
+
+    async def reset(self):
+        pass
+
+
+class PubSubClient:
+    def __init__(self):
+        self.subscriptions = 0
+
+    def pubsub(self) -> BrokenPubSub:
+        return BrokenPubSub(self)
+
+
+def test_listener_survives_unexpected_errors():
+    cache = HotFundCache(max_bytes=1 << 20, channel="test")
+    client = PubSubClient()
+
+    async def listen():
+        task = asyncio.ensure_future(cache.listen(client, retry_interval=0.05, poll_timeout=0.01))
+        await asyncio.sleep(0.01)
+        # the first subscription failed: nothing served until the next one
+        states = [(client.subscriptions, cache.listening)]
+        await asyncio.sleep(0.1)
+        states.append((client.subscriptions, cache.listening))
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return states
+
+    assert asyncio.run(listen()) == [(1, False), (2, True)]
+    assert not cache.listening
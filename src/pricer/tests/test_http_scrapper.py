@@ -0,0 +1,75 @@
+import asyncio
+from datetime import date
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import httpx
+
+import http_scrapper
+from http_scrapper import HttpScrapper, anchor_href, hidden_fields, month_options, span_text
+
+FIXTURES = Path(__file__).parent / "fixtures"
+CVM_URL = "https://cvmweb.cvm.gov.br/SWB/Sistemas/SCW/CPublica/CConsolFdo/ResultBuscaParticFdo.aspx?CNPJNome="
+FUND_URL = "https://cvmweb.cvm.gov.br/SWB/Sistemas/SCW/CPublica/InfDiario/CPublicaInfDiario.aspx?PK_PARTIC=%s"
+DETAILS_URL = (
+    "https://cvmweb.cvm.gov.br/SWB/Sistemas/SCW/CPublica/CConsolFdo/CPublicaCiaPartic.aspx?PK_PARTIC=132922&COMPTC="
+)
+CONTENT_TYPE = {"content-type": "text/html; charset=iso-8859-1"}
+
+
+def fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="latin-1")
+
+
+def test_hidden_fields():
+    fields = hidden_fields(fixture("search.html"))
+    assert fields["__EVENTTARGET"] == ""
+    assert fields["__VIEWSTATE"].endswith("Pj4+Pj4=")
+    assert fields["__EVENTVALIDATION"] == "/wEWAwLd&1uCQ"
+
+
+def test_fund_page():
+    page = fixture("fund.html")
+    assert span_text(page, "lbNmDenomSocial") == "FUNDO DE INVESTIMENTO MULTIMERCADO EXEMPLO"
+    assert span_text(page, "lbInfAdc1") == "14/09/2013"
+    assert span_text(page, "missing") == ""
+    assert anchor_href(page, "Hyperlink2") == "../InfDiario/CPublicaInfDiario.aspx?PK_PARTIC=132922&SemFrame="
+    assert anchor_href(page, "missing") is None
+
+
+def test_month_options():
+    assert [month_year for _, month_year, _ in month_options(fixture("daily_122022.html"))] == [
+        "12/2022", "11/2022", "10/2022"
+    ]
+    assert month_options(fixture("fund.html")) == []
+
+
+def test_get_funds_details(monkeypatch):
+    monkeypatch.setattr(http_scrapper.settings, "cvm_url", CVM_URL)
+    monkeypatch.setattr(http_scrapper.settings, "cvm_fund_url", FUND_URL)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if str(request.url) == DETAILS_URL:
+            return httpx.Response(200, content=(FIXTURES / "fund.html").read_bytes(), headers=CONTENT_TYPE)
+        if request.method == "GET":
+            return httpx.Response(200, content=(FIXTURES / "search.html").read_bytes(), headers=CONTENT_TYPE)
+        form = parse_qs(request.content.decode())
+        # the postback of the fund link replays the state of the search page
+        assert form["__EVENTTARGET"] == ["ddlFundos$_ctl0$lnkbtn1"]
+        assert form["__EVENTVALIDATION"] == ["/wEWAwLd&1uCQ"]
+        return httpx.Response(302, headers={"location": DETAILS_URL})
+
+    async def details():
+        scrapper = HttpScrapper()
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport, follow_redirects=True) as client:
+            return scrapper, await scrapper.get_funds_details("18993924000100", client)
+
+    scrapper, link = asyncio.run(details())
+
+    assert link == FUND_URL % "132922" + "&SemFrame="
+    fund = scrapper.fund_ts_model
+    assert fund.fund_pk == "132922"
+    assert fund.fund_name == "FUNDO DE INVESTIMENTO MULTIMERCADO EXEMPLO"
+    assert fund.released_on == date(2013, 9, 14)
+    assert fund.active is True
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from time import perf_counter
+
+import httpx
+
+from main import app, get_redis
+from redis.connector import RedisConnector
+from scrapper import run_blocking
+
+SCRAPE_SECONDS = 2.0
+# far below the blocked call, the quote must not wait for it
+MAX_LATENCY = 0.5
+
+
+class QuoteRedis(RedisConnector):
+    """Connector answering the quote lookups without a Redis server."""
+
+    async def get_last_quote(self, document: str, asked_date):
+        return int(datetime(2022, 12, 1).timestamp()), "2.345678901234"
+
+    async def get_cached_model(self, document: str):
+        return None
+
+
+def quote_redis() -> RedisConnector:
+    return QuoteRedis()
+
+
+def test_quotes_answer_while_a_scrape_blocks():
+    app.dependency_overrides[get_redis] = quote_redis
+    started = threading.Event()
+
+    def slow_scrape():
+        started.set()
+        time.sleep(SCRAPE_SECONDS)
+
+    async def quote_during_scrape():
+        scrape = asyncio.create_task(run_blocking(slow_scrape))
+        await asyncio.to_thread(started.wait)
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            s = perf_counter()
+            response = await client.get(
+                "/v1/funds/quotes/18993924000100", params={"investment": 1000, "date": "02/12/2022"}
+            )
+            elapsed = perf_counter() - s
+        running = not scrape.done()
+        await scrape
+        return response, elapsed, running
+
+    try:
+        response, elapsed, running = asyncio.run(quote_during_scrape())
+    finally:
+        app.dependency_overrides.clear()
+
+    assert running
+    assert response.status_code == 200
+    assert response.json()["quote_date"] == "2022-12-01T00:00:00"
+    assert elapsed < MAX_LATENCY
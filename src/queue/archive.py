@@ -0,0 +1,128 @@
+"""Move the cold history of funds from Redis to Parquet files, keeping only a hot window in RAM.
+
+Daily quotes older than the first day of the month HOT_WINDOW_DAYS ago are appended to
+ARCHIVE_DIR/document=<doc>/year=<YYYY>.parquet, PRICER_archived_<doc> is set to that day (the API reads older
+quotes from the files) and every series of the fund, daily, compacted and derived, gets a RETENTION that lets
+Redis drop them: the API computes compacted buckets and derived returns of archived days from the archived quotes.
+Quotes scraped later for archived days are written to the files by the workers and the API.
+The retention keeps ARCHIVE_MARGIN_DAYS more than the hot window, run this at least that often, e.g. daily:
+
+    python archive.py --all
+    python archive.py 18993924000100 ...
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import aioredis as redis
+
+import archive_files
+from archive_files import SCHEMA
+from queue_settings import Settings, logger
+from ts_writer import KEY_PREFIX, compacted_key, compactions, series_labels
+
+settings = Settings()
+
+# series key metric -> archive column
+METRIC_COLUMNS = {"value": "value", "owners": "owners", "networth": "net_worth"}
+DERIVED_METRICS = ("logret", "cumidx")
+
+
+def watermark_key(document: str) -> str:
+    return f"{KEY_PREFIX}archived_{document}"
+
+
+def archive_cutoff(now: datetime = None) -> int:
+    """First day of the month HOT_WINDOW_DAYS ago: only whole closed months leave Redis."""
+    oldest = (now or datetime.now()) - timedelta(days=settings.hot_window_days)
+    return int(oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+
+def merge_rows(document: str, rows: Dict[int, dict]) -> int:
+    """Merge `rows` (timestamp -> columns) into the year files of a fund, returns the number of year files."""
+    return archive_files.merge_rows(settings.archive_dir, document, rows)
+
+
+def series_keys(document: str) -> List[str]:
+    """Every series of a fund: daily quotes, their compacted companions and the derived series."""
+    keys = []
+    for metric in METRIC_COLUMNS:
+        key = f"{KEY_PREFIX}{metric}_{document}"
+        keys.append(key)
+        keys.extend(compacted_key(key, resolution, aggregation) for resolution, aggregation, _ in compactions(key))
+    keys.extend(f"{KEY_PREFIX}{metric}_{document}" for metric in DERIVED_METRICS)
+    return keys
+
+
+class Archiver:
+    def __init__(self, redis_client: redis.Redis):
+        self.logger = logger
+        self.redis = redis_client
+        self.retention = (settings.hot_window_days + settings.archive_margin_days) * 24 * 3600
+
+    async def archive_fund(self, document: str, cutoff: int) -> int:
+        keys = {metric: f"{KEY_PREFIX}{metric}_{document}" for metric in METRIC_COLUMNS}
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys.values():
+            # from the start, late writes of old months are archived too
+            pipe.execute_command('TS.RANGE', key, '-', cutoff - 1)
+        replies = await pipe.execute(raise_on_error=False)
+        rows: Dict[int, dict] = {}
+        for metric, reply in zip(keys, replies):
+            if isinstance(reply, Exception) or not reply:
+                continue
+            column = METRIC_COLUMNS[metric]
+            for timestamp, value in reply:
+                row = rows.setdefault(int(timestamp), dict.fromkeys(SCHEMA.names))
+                row["timestamp"] = int(timestamp)
+                row[column] = int(float(value)) if column == "owners" else float(value)
+        rows = {timestamp: row for timestamp, row in rows.items() if row["value"] is not None}
+        years = await asyncio.to_thread(merge_rows, document, rows)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(watermark_key(document), cutoff)
+        for key in series_keys(document):
+            pipe.execute_command('TS.ALTER', key, 'RETENTION', self.retention)
+        await pipe.execute(raise_on_error=False)
+        self.logger.info(f"Archived {len(rows)} days of {document} in {years} year files")
+        return len(rows)
+
+    async def documents(self) -> List[str]:
+        documents = []
+        async for key in self.redis.scan_iter(match=f"{KEY_PREFIX}value_*", count=1000):
+            labels = series_labels(key)
+            if "resolution" not in labels:
+                documents.append(labels["document"])
+        return documents
+
+    async def run(self, documents: Optional[List[str]] = None) -> int:
+        cutoff = archive_cutoff()
+        documents = documents or await self.documents()
+        archived = 0
+        for document in documents:
+            archived += await self.archive_fund(document, cutoff)
+        self.logger.info(
+            f"Archived {archived} days of {len(documents)} funds before {datetime.fromtimestamp(cutoff):%d/%m/%Y}"
+        )
+        return archived
+
+
+async def archive(documents: List[str]):
+    client = redis.Redis(host=settings.redis_host, decode_responses=True, encoding="utf-8")
+    await Archiver(client).run(documents)
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive cold fund history to Parquet files")
+    parser.add_argument("documents", nargs="*", help="fund documents (CNPJ digits)")
+    parser.add_argument("--all", action="store_true", help="every fund with a value series")
+    args = parser.parse_args()
+    if not args.documents and not args.all:
+        parser.error("give documents or --all")
+    asyncio.run(archive(args.documents))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Load the CDI daily rate (BCB SGS series 12) as derived series, the benchmark of CDI-relative analytics.
+
+    PRICER_logret_CDI  daily log return, ln(1 + rate / 100)
+    PRICER_cumidx_CDI  cumulative sum of the daily log returns
+
+Without --from the load resumes after the last stored day, with it the days from then on are loaded again:
+
+    python cdi.py
+    python cdi.py --from 01/01/2000
+"""
+import argparse
+import asyncio
+import math
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import aioredis as redis
+import httpx
+
+from derived import cumidx_key, logret_key
+from queue_settings import Settings, logger
+from ts_writer import TimeSeriesWriter
+
+settings = Settings()
+
+CDI = "CDI"
+# SGS returns at most 10 years of a daily series per request
+WINDOW_DAYS = 3650
+
+
+async def fetch_rates(client: httpx.AsyncClient, start: datetime, end: datetime) -> List[Tuple[int, float]]:
+    rates = []
+    while start <= end:
+        window_end = min(start + timedelta(days=WINDOW_DAYS), end)
+        response = await client.get(
+            settings.cdi_url,
+            params={
+                "formato": "json",
+                "dataInicial": start.strftime("%d/%m/%Y"),
+                "dataFinal": window_end.strftime("%d/%m/%Y")
+            }
+        )
+        response.raise_for_status()
+        for row in response.json():
+            day = datetime.strptime(row["data"], "%d/%m/%Y")
+            rates.append((int(day.timestamp()), float(row["valor"])))
+        start = window_end + timedelta(days=1)
+    return sorted(dict(rates).items())
+
+
+async def last_point(client: redis.Redis, before="+") -> Optional[Tuple[int, float]]:
+    try:
+        reply = await client.execute_command('TS.REVRANGE', cumidx_key(CDI), '-', before, 'COUNT', 1)
+    except redis.ResponseError:
+        return None
+    return (int(reply[0][0]), float(reply[0][1])) if reply else None
+
+
+async def load(from_date: Optional[str]):
+    client = redis.Redis(host=settings.redis_host, decode_responses=True, encoding="utf-8")
+    writer = TimeSeriesWriter(client, duplicate_policy="last", chunk_size=settings.madd_batch_size)
+    if from_date is not None:
+        start = datetime.strptime(from_date, "%d/%m/%Y")
+        # keep the index continuous with the days stored before the rebuilt ones
+        previous = await last_point(client, int(start.timestamp()) - 1)
+    else:
+        previous = await last_point(client)
+        if previous is None:
+            start = datetime.strptime(settings.cdi_start, "%d/%m/%Y")
+        else:
+            start = datetime.fromtimestamp(previous[0]) + timedelta(days=1)
+    cumulative = previous[1] if previous is not None else 0.0
+    async with httpx.AsyncClient(timeout=settings.http_timeout) as http:
+        rates = await fetch_rates(http, start, datetime.now())
+    samples = []
+    for timestamp, rate in rates:
+        daily = math.log1p(rate / 100)
+        cumulative += daily
+        samples.append((logret_key(CDI), timestamp, daily))
+        samples.append((cumidx_key(CDI), timestamp, cumulative))
+    await writer.ensure_series((logret_key(CDI), cumidx_key(CDI)))
+    await writer.madd(samples)
+    logger.info(f"Loaded {len(rates)} CDI days from {start:%d/%m/%Y}")
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the CDI daily rate from the BCB SGS API")
+    parser.add_argument("--from", dest="from_date", default=None, help="rebuild from this day, dd/mm/yyyy")
+    args = parser.parse_args()
+    asyncio.run(load(args.from_date))
+
+
+if __name__ == "__main__":
+    main()
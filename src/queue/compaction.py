@@ -0,0 +1,59 @@
+"""One-off backfill of the compacted companions (see ts_writer.COMPACTIONS) of series created before them.
+
+For every daily value and net worth series the companion and its TS.CREATERULE are created first, so samples
+written meanwhile are not missed, then the whole history is aggregated server side with TS.RANGE ... AGGREGATION
+and written to the companion:
+
+    python compaction.py
+"""
+import asyncio
+from typing import List
+
+import aioredis as redis
+
+from queue_settings import Settings, logger
+from ts_writer import COMPACTIONS, KEY_PREFIX, TimeSeriesWriter, compacted_key, compactions, labels_args, series_labels
+
+settings = Settings()
+
+
+async def daily_series(client: redis.Redis) -> List[str]:
+    keys = []
+    for metric in COMPACTIONS:
+        async for key in client.scan_iter(match=f"{KEY_PREFIX}{metric}_*", count=1000):
+            if "resolution" not in series_labels(key):
+                keys.append(key)
+    return keys
+
+
+async def backfill(client: redis.Redis, writer: TimeSeriesWriter, key: str) -> int:
+    written = 0
+    for resolution, aggregation, bucket in compactions(key):
+        destination = compacted_key(key, resolution, aggregation)
+        pipe = client.pipeline(transaction=False)
+        pipe.execute_command(
+            'TS.CREATE', destination, 'DUPLICATE_POLICY', 'last', *labels_args(series_labels(destination))
+        )
+        pipe.execute_command('TS.CREATERULE', key, destination, 'AGGREGATION', aggregation, bucket)
+        for result in await pipe.execute(raise_on_error=False):
+            if isinstance(result, Exception):
+                # companion or rule already there
+                logger.debug(f"{destination}: {result}")
+        buckets = await client.execute_command('TS.RANGE', key, '-', '+', 'AGGREGATION', aggregation, bucket)
+        written += await writer.madd([(destination, int(ts), value) for ts, value in buckets])
+    return written
+
+
+async def main():
+    client = redis.Redis(host=settings.redis_host, decode_responses=True, encoding="utf-8")
+    writer = TimeSeriesWriter(client, duplicate_policy="last", chunk_size=settings.madd_batch_size)
+    keys = await daily_series(client)
+    written = 0
+    for key in keys:
+        written += await backfill(client, writer, key)
+    logger.info(f"Backfilled {written} compacted samples of {len(keys)} series")
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
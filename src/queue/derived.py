@@ -0,0 +1,131 @@
+"""Derived series of every fund, kept next to its quotes so analytics never rescan a full history.
+
+    PRICER_logret_<doc>  daily log return, ln(value_t / value_t-1)
+    PRICER_cumidx_<doc>  cumulative log index, ln(value_t): the difference between two points is the log return
+                         between them, so it does not depend on the order months are scraped in
+
+Existing histories are rebuilt from their value series with:
+
+    python derived.py 18993924000100 ...
+    python derived.py --all
+"""
+import argparse
+import asyncio
+import math
+from typing import Dict, List, Optional, Tuple
+
+import aioredis as redis
+
+from queue_settings import Settings, logger
+from ts_writer import KEY_PREFIX, TimeSeriesWriter
+
+settings = Settings()
+
+Point = Tuple[int, float]
+
+
+def value_key(document: str) -> str:
+    return f"{KEY_PREFIX}value_{document}"
+
+
+def logret_key(document: str) -> str:
+    return f"{KEY_PREFIX}logret_{document}"
+
+
+def cumidx_key(document: str) -> str:
+    return f"{KEY_PREFIX}cumidx_{document}"
+
+
+def derived_samples(document: str, points: List[Point], previous: Optional[Point], following: Optional[Point]):
+    """Samples of the derived series for `points` (sorted, positive values) written between two existing quotes."""
+    samples = []
+    prev_value = previous[1] if previous is not None else None
+    for timestamp, value in points:
+        samples.append((cumidx_key(document), timestamp, math.log(value)))
+        if prev_value is not None:
+            samples.append((logret_key(document), timestamp, math.log(value / prev_value)))
+        prev_value = value
+    if following is not None and points:
+        # the first quote after the batch gets its return now that the one before it exists
+        samples.append((logret_key(document), following[0], math.log(following[1] / points[-1][1])))
+    return samples
+
+
+def first_sample(reply) -> Optional[Point]:
+    if isinstance(reply, Exception) or not reply:
+        return None
+    timestamp, value = reply[0]
+    return int(timestamp), float(value)
+
+
+class DerivedSeries:
+    """Maintain the derived series of funds as new quotes are written.
+
+    Only the quotes just before and just after each batch are read, in a single pipeline.
+    """
+
+    def __init__(self, redis_client: redis.Redis, writer: TimeSeriesWriter):
+        self.logger = logger
+        self.redis = redis_client
+        self.writer = writer
+
+    async def update(self, batches: Dict[str, List[Point]], fund_pk: Optional[str] = None) -> int:
+        batches = {
+            document: sorted({ts: v for ts, v in points if v > 0}.items())
+            for document, points in batches.items()
+        }
+        batches = {document: points for document, points in batches.items() if points}
+        if not batches:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for document, points in batches.items():
+            pipe.execute_command('TS.REVRANGE', value_key(document), '-', points[0][0] - 1, 'COUNT', 1)
+            pipe.execute_command('TS.RANGE', value_key(document), points[-1][0] + 1, '+', 'COUNT', 1)
+        neighbours = await pipe.execute(raise_on_error=False)
+        samples = []
+        for i, (document, points) in enumerate(batches.items()):
+            previous, following = first_sample(neighbours[2 * i]), first_sample(neighbours[2 * i + 1])
+            if following is not None and following[1] <= 0:
+                following = None
+            samples.extend(derived_samples(document, points, previous, following))
+        await self.writer.ensure_series((key for key, _, _ in samples), fund_pk)
+        return await self.writer.madd(samples)
+
+    async def rebuild(self, document: str) -> int:
+        """Recompute the derived series of a fund from its whole value series."""
+        reply = await self.redis.execute_command('TS.RANGE', value_key(document), '-', '+')
+        points = [(int(ts), float(v)) for ts, v in reply if float(v) > 0]
+        samples = derived_samples(document, points, None, None)
+        await self.writer.ensure_series((logret_key(document), cumidx_key(document)))
+        written = await self.writer.madd(samples)
+        self.logger.info(f"Derived series of {document} rebuilt from {len(points)} quotes")
+        return written
+
+    async def documents(self) -> List[str]:
+        prefix = value_key("")
+        documents = [key[len(prefix):] async for key in self.redis.scan_iter(match=f"{prefix}*", count=1000)]
+        # compacted companions are PRICER_value_<doc>_<resolution>_<aggregation>
+        return [document for document in documents if "_" not in document]
+
+
+async def rebuild(documents: List[str], rebuild_all: bool):
+    client = redis.Redis(host=settings.redis_host, decode_responses=True, encoding="utf-8")
+    writer = TimeSeriesWriter(client, duplicate_policy="last", chunk_size=settings.madd_batch_size)
+    derived = DerivedSeries(client, writer)
+    if rebuild_all:
+        documents = await derived.documents()
+    for document in documents:
+        await derived.rebuild(document)
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the derived series of funds from their quotes")
+    parser.add_argument("documents", nargs="*", help="fund documents (CNPJ digits)")
+    parser.add_argument("--all", action="store_true", help="every fund with a value series")
+    args = parser.parse_args()
+    asyncio.run(rebuild(args.documents, args.all))
+
+
+if __name__ == "__main__":
+    main()
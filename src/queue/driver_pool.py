@@ -0,0 +1,142 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from queue_settings import Settings, logger
+
+settings = Settings()
+
+# Selenium calls block, they run on dedicated threads so the event loop keeps reading the stream.
+browser_executor = ThreadPoolExecutor(max_workers=settings.driver_pool_size + 1, thread_name_prefix="webdriver")
+
+
+async def run_blocking(func, *args, timeout: float = None):
+    """Run a blocking browser call on `browser_executor`, raising asyncio.TimeoutError after `timeout` seconds."""
+    loop = asyncio.get_running_loop()
+    timeout = timeout if timeout is not None else settings.browser_timeout
+    return await asyncio.wait_for(loop.run_in_executor(browser_executor, func, *args), timeout)
+
+
+def chrome_options() -> webdriver.ChromeOptions:
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    chrome_prefs = dict()
+    options.experimental_options["prefs"] = chrome_prefs
+    chrome_prefs["profile.default_content_settings"] = {"images": 2}  # disable image
+    return options
+
+
+@dataclass
+class PooledDriver:
+    driver: webdriver.Chrome
+    uses: int = field(default=0)
+    created_at: float = field(default_factory=perf_counter)
+
+
+class WebDriverPool:
+    """Bounded pool of long-lived headless Chrome sessions shared across queue messages.
+
+    Sessions are health-checked on checkout and recycled after `max_uses` or when they crash.
+    """
+
+    def __init__(self, size: int = None, max_uses: int = None):
+        self.logger = logger
+        self.size = size if size is not None else settings.driver_pool_size
+        self.max_uses = max_uses if max_uses is not None else settings.driver_max_uses
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.size)
+        self.created = 0
+        self.recycled = 0
+        self.in_use = 0
+
+    def _new_driver(self) -> PooledDriver:
+        self.created += 1
+        self.logger.debug(f"Starting webdriver session #{self.created}")
+        return PooledDriver(driver=webdriver.Chrome('chromedriver', options=chrome_options()))
+
+    async def _discard(self, session: PooledDriver, reason: str):
+        self.recycled += 1
+        self.logger.info(f"Recycling webdriver session after {session.uses} uses: {reason}")
+        try:
+            await run_blocking(session.driver.quit)
+        except (WebDriverException, asyncio.TimeoutError) as e:
+            self.logger.debug(f"Error while closing webdriver: {e}")
+
+    @staticmethod
+    def is_healthy(session: PooledDriver) -> bool:
+        try:
+            session.driver.execute_script("return 1")
+        except WebDriverException:
+            return False
+        return True
+
+    async def _checkout(self) -> PooledDriver:
+        await self._slots.acquire()
+        try:
+            while not self._idle.empty():
+                session = self._idle.get_nowait()
+                try:
+                    healthy = await run_blocking(self.is_healthy, session, timeout=settings.health_check_timeout)
+                except asyncio.TimeoutError:
+                    healthy = False
+                if healthy:
+                    return session
+                await self._discard(session, "failed health check")
+            return await run_blocking(self._new_driver)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _checkin(self, session: PooledDriver, crashed: bool):
+        session.uses += 1
+        try:
+            if crashed:
+                await self._discard(session, "crashed")
+            elif session.uses >= self.max_uses:
+                await self._discard(session, "max uses reached")
+            else:
+                self._idle.put_nowait(session)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def session(self):
+        session = await self._checkout()
+        self.in_use += 1
+        crashed = False
+        try:
+            yield session.driver
+        except (WebDriverException, asyncio.TimeoutError):
+            # a timed out call may still hold the browser, never hand it to another job
+            crashed = True
+            raise
+        finally:
+            self.in_use -= 1
+            await self._checkin(session, crashed)
+            self.logger.debug(f"Webdriver pool: {self.stats()}")
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "idle": self._idle.qsize(),
+            "utilisation": round(self.in_use / self.size, 2) if self.size else 0,
+            "created": self.created,
+            "recycled": self.recycled,
+        }
+
+    def close(self):
+        while not self._idle.empty():
+            session = self._idle.get_nowait()
+            try:
+                session.driver.quit()
+            except WebDriverException:
+                pass
+        self.logger.info(f"Webdriver pool closed: {self.stats()}")
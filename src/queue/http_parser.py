@@ -0,0 +1,74 @@
+from typing import AsyncIterator, List, Tuple
+
+import httpx
+
+from cvm_page import HEADERS, MONTH_SELECTOR, hidden_fields, month_options
+from queue_models import PubSubMsg, TimeSeries, FundTS, InvalidDateTime
+from queue_settings import Settings, logger
+from table_parser import parse_daily_table
+
+settings = Settings()
+
+class HttpDataParser:
+    """Scrape the daily quotes page replaying ASP.NET postbacks, without a browser.
+
+    Drop-in replacement for `DataParser`, selected with SCRAPER_ENGINE=http.
+    """
+
+    def __init__(self, client: httpx.AsyncClient = None):
+        self.logger = logger
+        self.client = client
+
+    async def post_back(self, url: str, page: str, target: str, value: str) -> str:
+        form = hidden_fields(page)
+        form["__EVENTTARGET"] = target
+        form["__EVENTARGUMENT"] = ""
+        form[target] = value
+        response = await self.client.post(url, data=form)
+        response.raise_for_status()
+        return response.text
+
+    async def parse_month(self, url: str, page: str, month_year: str) -> Tuple[str, List[TimeSeries]]:
+        """Select `month_year` on the loaded page, returns the new page state and the parsed grid."""
+        options = dict((month, (value, selected)) for value, month, selected in month_options(page))
+        if month_year not in options:
+            raise InvalidDateTime(f"Could not find date:{month_year} to parse.")
+        self.logger.debug(f"Parsing {month_year}")
+        value, selected = options[month_year]
+        if not selected:
+            page = await self.post_back(url, page, MONTH_SELECTOR, value)
+        return page, parse_daily_table(page, month_year)
+
+    @staticmethod
+    def month_model(msg: PubSubMsg, parsed_ts: List[TimeSeries]) -> FundTS:
+        fund_ts_model = FundTS(document=msg.document, fund_pk=msg.fund_pk)
+        if parsed_ts:
+            fund_ts_model.timeseries = sorted(parsed_ts)
+            fund_ts_model.last_query_date = max(parsed_ts).timestamp
+        return fund_ts_model
+
+    async def parse_months(
+            self,
+            msg: PubSubMsg
+    ) -> AsyncIterator[Tuple[str, FundTS]]:
+        """Load the fund page once and chain the ddComptc postbacks for every month of the message."""
+        fund_daily_link = settings.cvm_fund_url % msg.fund_pk
+        self.logger.info("start http scraper for %s" % fund_daily_link)
+        own_client = self.client is None
+        if own_client:
+            self.client = httpx.AsyncClient(headers=HEADERS, timeout=settings.http_timeout, follow_redirects=True)
+        try:
+            response = await self.client.get(fund_daily_link)
+            response.raise_for_status()
+            page = response.text
+            for month_year in msg.month_list():
+                try:
+                    page, parsed_ts = await self.parse_month(fund_daily_link, page, month_year)
+                except InvalidDateTime as e:
+                    self.logger.error(e)
+                    continue
+                yield month_year, self.month_model(msg, parsed_ts)
+        finally:
+            if own_client:
+                await self.client.aclose()
+                self.client = None
@@ -0,0 +1,206 @@
+"""Bulk load of CVM open data daily reports (inf_diario_fi_YYYYMM.csv or .zip) into RedisTimeSeries.
+
+Every file covers all the funds of a month, rows are streamed in chunks and written with pipelined TS.MADD
+into the same PRICER_value_/owners_/networth_ keys used by the scrapers.
+Progress is checkpointed by file and month, so an interrupted run can simply be started again:
+
+    python ingest.py inf_diario_fi_202201.zip inf_diario_fi_202202.csv --from-month 01/2022
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import zipfile
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from time import perf_counter
+from typing import Iterator, List, Optional, Tuple
+
+import aioredis as redis
+
+from archive import merge_rows, watermark_key
+from main import QueueConnector
+from queue_settings import Settings, logger
+
+settings = Settings()
+
+CHECKPOINT_KEY = "PRICER_ingest_checkpoint"
+DONE = "done"
+CNPJ_COLUMNS = ("CNPJ_FUNDO", "CNPJ_FUNDO_CLASSE")
+
+
+def document_from_cnpj(cnpj: str) -> str:
+    return "".join(char for char in cnpj if char.isdigit())
+
+
+def month_of(value: str) -> Optional[Tuple[int, int]]:
+    """`MM/YYYY` command line month as a comparable (year, month)."""
+    if value is None:
+        return None
+    parsed = datetime.strptime(f"01/{value}", "%d/%m/%Y")
+    return parsed.year, parsed.month
+
+
+class InfDiarioIngestor:
+    def __init__(
+            self,
+            connector: QueueConnector,
+            chunk_size: int = None,
+            from_month: str = None,
+            to_month: str = None
+    ):
+        self.logger = logger
+        self.connector = connector
+        self.redis = connector.redis
+        self.writer = connector.writer
+        self.chunk_size = chunk_size if chunk_size is not None else settings.ingest_chunk_size
+        self.from_month = month_of(from_month)
+        self.to_month = month_of(to_month)
+        self.documents = set()
+        self.samples = 0
+
+    @staticmethod
+    def open_sources(path: str) -> Iterator[Tuple[str, io.TextIOBase]]:
+        """(checkpoint id, text stream) for a csv file or for every csv inside a zip file."""
+        file_name = os.path.basename(path)
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for member in sorted(archive.namelist()):
+                    if not member.lower().endswith(".csv"):
+                        continue
+                    with archive.open(member) as raw:
+                        yield f"{file_name}:{member}", io.TextIOWrapper(raw, encoding="latin-1", newline="")
+        else:
+            with open(path, encoding="latin-1", newline="") as stream:
+                yield file_name, stream
+
+    def in_window(self, sample_date: datetime) -> bool:
+        month = (sample_date.year, sample_date.month)
+        if self.from_month is not None and month < self.from_month:
+            return False
+        if self.to_month is not None and month > self.to_month:
+            return False
+        return True
+
+    def parse_row(self, row: dict) -> Optional[Tuple[str, int, str, float, int]]:
+        cnpj = next((row[column] for column in CNPJ_COLUMNS if row.get(column)), None)
+        if cnpj is None or not row.get("VL_QUOTA"):
+            return None
+        try:
+            sample_date = datetime.strptime(row["DT_COMPTC"], "%Y-%m-%d")
+            if not self.in_window(sample_date):
+                return None
+            return (
+                document_from_cnpj(cnpj),
+                int(sample_date.timestamp()),
+                str(Decimal(row["VL_QUOTA"]).quantize(Decimal("1.000000000"))),
+                float(row.get("VL_PATRIM_LIQ") or 0),
+                int(float(row.get("NR_COTST") or 0)),
+            )
+        except (KeyError, ValueError, InvalidOperation) as e:
+            self.logger.debug(f"Skipping row {row}: {e}")
+            return None
+
+    async def archive_late(self, samples: List[Tuple[str, int, str, float, int]]):
+        """Samples of days already archived are merged into the Parquet files, the rest is returned."""
+        if not samples:
+            return []
+        documents = list({sample[0] for sample in samples})
+        watermarks = dict(zip(documents, await self.redis.mget([watermark_key(document) for document in documents])))
+        hot, late = [], defaultdict(dict)
+        for sample in samples:
+            document, timestamp, value, net_worth, owners = sample
+            watermark = watermarks[document]
+            if watermark is not None and timestamp < int(watermark):
+                late[document][timestamp] = {
+                    "timestamp": timestamp, "value": float(value), "owners": owners, "net_worth": net_worth
+                }
+            else:
+                hot.append(sample)
+        for document, rows in late.items():
+            await asyncio.to_thread(merge_rows, document, rows)
+            self.documents.add(document)
+            self.samples += 3 * len(rows)
+        return hot
+
+    async def write_chunk(self, samples: List[Tuple[str, int, str, float, int]]):
+        series = []
+        quotes = defaultdict(list)
+        for document, timestamp, value, net_worth, owners in await self.archive_late(samples):
+            value_key, owner_key, networth_key = self.connector.keys(document)
+            series.extend(((value_key, timestamp, value), (owner_key, timestamp, owners), (networth_key, timestamp, net_worth)))
+            quotes[document].append((timestamp, float(value)))
+            self.documents.add(document)
+        await self.writer.ensure_series(key for key, _, _ in series)
+        self.samples += await self.writer.madd(series)
+        await self.connector.derived.update(quotes)
+
+    async def ingest_source(self, source_id: str, stream: io.TextIOBase):
+        if self.from_month is not None or self.to_month is not None:
+            # a partial load of a file must not mark the whole file as done
+            source_id = f"{source_id}[{self.from_month}:{self.to_month}]"
+        checkpoint = await self.redis.hget(CHECKPOINT_KEY, source_id)
+        if checkpoint == DONE:
+            self.logger.info(f"{source_id} already ingested, skipping")
+            return
+        committed_rows = int(checkpoint or 0)
+        if committed_rows:
+            self.logger.info(f"Resuming {source_id} after row {committed_rows}")
+        rows_read = 0
+        chunk = []
+        for row in csv.DictReader(stream, delimiter=";"):
+            rows_read += 1
+            if rows_read <= committed_rows:
+                continue
+            sample = self.parse_row(row)
+            if sample is not None:
+                chunk.append(sample)
+            if rows_read % self.chunk_size == 0:
+                if chunk:
+                    await self.write_chunk(chunk)
+                    chunk = []
+                await self.redis.hset(CHECKPOINT_KEY, source_id, rows_read)
+        if chunk:
+            await self.write_chunk(chunk)
+        await self.redis.hset(CHECKPOINT_KEY, source_id, DONE)
+        self.logger.info(f"{source_id} ingested, {rows_read} rows")
+
+    async def ingest(self, paths: List[str]):
+        s = perf_counter()
+        for path in paths:
+            for source_id, stream in self.open_sources(path):
+                try:
+                    await self.ingest_source(source_id, stream)
+                except (redis.ResponseError, redis.ConnectionError) as e:
+                    self.logger.error(f"Ingestion of {source_id} stopped, run again to resume: {e}")
+                    raise
+        elapsed = perf_counter() - s
+        # too many funds to name, API replicas drop their whole in-process cache
+        await self.redis.publish(settings.invalidation_channel, "*")
+        self.logger.info(
+            f"Ingested {self.samples} samples of {len(self.documents)} funds in {elapsed:0.2f} s "
+            f"({self.samples / elapsed if elapsed else 0:0.0f} samples/s)."
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load CVM inf_diario_fi files into RedisTimeSeries")
+    parser.add_argument("paths", nargs="+", help="inf_diario_fi csv or zip files")
+    parser.add_argument("--chunk-size", type=int, default=None, help="rows per pipeline flush")
+    parser.add_argument("--from-month", default=None, help="first month to load, MM/YYYY")
+    parser.add_argument("--to-month", default=None, help="last month to load, MM/YYYY")
+    args = parser.parse_args()
+
+    ingestor = InfDiarioIngestor(
+        QueueConnector(),
+        chunk_size=args.chunk_size,
+        from_month=args.from_month,
+        to_month=args.to_month
+    )
+    asyncio.run(ingestor.ingest(args.paths))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""One-off labeling of the series created before they were labeled (see ts_writer.series_labels).
+
+TS.MRANGE/TS.MGET filter by the document, metric and resolution labels, unlabeled series are invisible to
+them (fund comparison, last quote timestamps). Every series without a document label gets its labels with
+TS.ALTER, fund_pk is taken from the PRICER_<doc> metadata when there is one:
+
+    python labels.py
+"""
+import asyncio
+import json
+from typing import Dict, List, Optional
+
+import aioredis as redis
+
+from queue_settings import Settings, logger
+from ts_writer import KEY_PREFIX, labels_args, series_labels
+
+settings = Settings()
+
+METRICS = ("value", "owners", "networth", "logret", "cumidx")
+BATCH_SIZE = 1000
+
+
+def info_labels(reply) -> Dict[str, str]:
+    info = dict(zip(reply[::2], reply[1::2]))
+    return {name: value for name, value in info.get("labels") or ()}
+
+
+async def fund_pks(client: redis.Redis, documents: List[str]) -> Dict[str, Optional[str]]:
+    metadata = await client.mget([f"{KEY_PREFIX}{document}" for document in documents])
+    pks = {}
+    for document, fund in zip(documents, metadata):
+        fund_pk = json.loads(fund).get("fund_pk") if fund else None
+        pks[document] = str(fund_pk) if fund_pk is not None else None
+    return pks
+
+
+async def label_batch(client: redis.Redis, keys: List[str]) -> int:
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.execute_command('TS.INFO', key)
+    unlabeled = [
+        key for key, reply in zip(keys, await pipe.execute(raise_on_error=False))
+        if not isinstance(reply, Exception) and "document" not in info_labels(reply)
+    ]
+    if not unlabeled:
+        return 0
+    labels = {key: series_labels(key) for key in unlabeled}
+    pks = await fund_pks(client, list({key_labels["document"] for key_labels in labels.values()}))
+    pipe = client.pipeline(transaction=False)
+    for key in unlabeled:
+        pipe.execute_command('TS.ALTER', key, *labels_args(series_labels(key, pks[labels[key]["document"]])))
+    for key, result in zip(unlabeled, await pipe.execute(raise_on_error=False)):
+        if isinstance(result, Exception):
+            logger.error(f"Could not label {key}: {result}")
+    return len(unlabeled)
+
+
+async def main():
+    client = redis.Redis(host=settings.redis_host, decode_responses=True, encoding="utf-8")
+    labeled = scanned = 0
+    for metric in METRICS:
+        batch = []
+        async for key in client.scan_iter(match=f"{KEY_PREFIX}{metric}_*", count=BATCH_SIZE, _type="TSDB-TYPE"):
+            batch.append(key)
+            if len(batch) == BATCH_SIZE:
+                labeled += await label_batch(client, batch)
+                scanned += len(batch)
+                batch = []
+        if batch:
+            labeled += await label_batch(client, batch)
+            scanned += len(batch)
+    logger.info(f"Labeled {labeled} of {scanned} series")
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,89 +1,37 @@
 import asyncio
 import dataclasses
-import functools
 import json
 import aioredis as redis
 import signal
 import threading
+from time import perf_counter
 
-from uuid import uuid4
 from decimal import Decimal
-from datetime import datetime, date
-from dataclasses import dataclass, field
-
-import async_timeout
+from datetime import datetime, date, timedelta
 
+from archive import merge_rows, watermark_key
+from derived import DerivedSeries
+from driver_pool import WebDriverPool, run_blocking
+from http_parser import HttpDataParser
+from queue_models import PubSubMsg, TimeSeries, FundTS, InvalidDateTime, StreamError
 from queue_settings import Settings, logger
-from typing import List, Optional, Tuple, Union
+from table_parser import parse_daily_table
+from ts_writer import TimeSeriesWriter
+from typing import AsyncIterator, Dict, List, Set, Tuple
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait  # type: ignore
+from selenium.webdriver.support.ui import Select, WebDriverWait  # type: ignore
 
 
 settings = Settings()
 thread_local = threading.local()
 
 
-@dataclass
-class PubSubMsg:
-    document: str
-    fund_pk: str
-    month_year: str
-    message_id: str = field(default=None)
-    saved: bool = field(default=False)
-    acked: bool = field(default=False)
-
-
-@dataclass(order=True)
-class TimeSeries:
-    sort_index: datetime = field(init=False, repr=False)
-    timestamp: datetime
-    value: Decimal
-    owners: [int]
-    net_worth_str: str = field(repr=False)
-    net_worth: float = field(init=False)
-
-    def __post_init__(self):
-        str_number = self.net_worth_str.replace('.', '').replace(',', '.')
-        parsed_num = float(str_number)
-        self.net_worth = parsed_num
-        self.sort_index = self.timestamp
-
-
-@dataclass
-class FundTS:
-    document: Optional[str] = None
-    fund_pk: Optional[str] = None
-    active: Optional[bool] = False
-    fund_name: Optional[str] = None
-    released_on: Optional[date] = None
-    first_query_date: Optional[date] = None
-    last_query_date: Optional[date] = None
-    timeseries: Optional[List[TimeSeries]] = None
-
-
-class InvalidDateTime(Exception):
-    pass
-
-
-class StreamError(Exception):
-    pass
-
-
 class DataParser:
-    def __init__(self):
+    def __init__(self, driver_pool: WebDriverPool):
         self.logger = logger
-        self.fund_ts_model = FundTS()
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_prefs = dict()
-        chrome_options.experimental_options["prefs"] = chrome_prefs
-        chrome_prefs["profile.default_content_settings"] = {"images": 2}  # disable image
-        self.chrome_options = chrome_options
+        self.driver_pool = driver_pool
 
     @staticmethod
     def select_parse_date(available_date_list: list, parse_date: str) -> Tuple:
@@ -92,7 +40,8 @@ class DataParser:
         date2parse = next(
             filter(
                 lambda x: x[1] == parse_date, available_date_datetime
-            )
+            ),
+            None
         )
         # parse_date_end = parse_date_start + relativedelta(months=1)
         # available_date_datetime = [
@@ -105,72 +54,68 @@ class DataParser:
                 f"Could not find date:{parse_date} to parse.")
         return date2parse
 
+    @staticmethod
+    def select_month(wd, i: int, month_year: str) -> str:
+        """Blocking: select the i-th ddComptc option and return the page source once the grid is loaded."""
+        selected = Select(wd.find_element(By.ID, "ddComptc")).first_selected_option
+        if selected.text.replace(" ", "") != month_year:
+            previous_table = wd.find_elements(By.ID, "dgDocDiario")
+            wd.find_element(By.XPATH, f"//*[@id='ddComptc']/option[{i}]").click()
+            # this will click the option which index is defined by position
+            if previous_table:
+                # the postback reloads the page, wait the old grid to go away
+                WebDriverWait(wd, 20).until(EC.staleness_of(previous_table[0]))
+        WebDriverWait(wd, 20).until(EC.presence_of_element_located((By.XPATH, '//*[@id="dgDocDiario"]')))
+        # one page_source transfer instead of a WebDriver round trip per row
+        return wd.page_source
+
+    @staticmethod
+    def open_fund_page(wd, fund_daily_link: str) -> List[str]:
+        """Blocking: load the fund page and return the months available on ddComptc."""
+        wd.get(fund_daily_link)
+        selectors = wd.find_element(By.XPATH, '//*[@id="ddComptc"]')
+        selectors_list = selectors.text.split("\n")
+        wd.execute_script(
+            "showDropdown = function (element) {var event; event = document.createEvent('MouseEvents'); event.initMouseEvent('mousedown', true, true, window); element.dispatchEvent(event); }; showDropdown(arguments[0]);",
+            selectors)
+        return [i.replace(' ', "") for i in selectors_list[:-1]]
+
     async def parse_data(self, wd, i=None, month_year=None):
         if isinstance(wd, tuple):
             i = wd[1]
             month_year = wd[2]
             wd = wd[0]
         self.logger.debug(f"Parsing {month_year}")
-        i += 1
-        wd.find_element(By.XPATH, f"//*[@id='ddComptc']/option[{i}]").click()
-        # this will click the option which index is defined by position
-        # await asyncio.sleep(3)
-        WebDriverWait(wd, 20).until(EC.presence_of_element_located((By.XPATH, '//*[@id="dgDocDiario"]')))
-        rows = wd.find_elements(By.XPATH, '//*[@id="dgDocDiario"]/tbody/tr')
-        timeseries_list = await self.read_rows(month_year, rows)
-        return timeseries_list
-
-    async def read_rows(self, month_year, rows):
-        timeseries_list = []
-        for row in rows[1:]:  # linha 0 header da tabela
-            daily_data = [field.replace(" ", "") for field in row.text.split(" ")]
-            value = daily_data[1]
-            date_field = daily_data[0]
-            if value != "":
-                try:
-                    net_worth = daily_data[4]
-                    owner_number = daily_data[6]
-                    datetime_stamp = datetime.strptime(f'{date_field}/{month_year}', "%d/%m/%Y")
-                    timeseries = TimeSeries(
-                        timestamp=datetime_stamp,
-                        value=Decimal(value.replace(",", ".")),
-                        net_worth_str=net_worth,
-                        owners=int(owner_number)
-                    )
-                    timeseries_list.append(timeseries)
-                except ValueError as e:
-                    self.logger.error(e)
-                    self.logger.error(date_field, month_year)
-        return timeseries_list
+        page_source = await run_blocking(self.select_month, wd, i + 1, month_year)
+        return parse_daily_table(page_source, month_year)
 
-    async def parser_fund(
+    @staticmethod
+    def month_model(msg: PubSubMsg, parsed_ts: List[TimeSeries]) -> FundTS:
+        fund_ts_model = FundTS(document=msg.document, fund_pk=msg.fund_pk)
+        if parsed_ts:
+            fund_ts_model.timeseries = sorted(parsed_ts)
+            fund_ts_model.last_query_date = max(parsed_ts).timestamp
+        return fund_ts_model
+
+    async def parse_months(
             self,
             msg: PubSubMsg
-    ) -> List[TimeSeries]:
+    ) -> AsyncIterator[Tuple[str, FundTS]]:
+        """Load the fund page once and walk the ddComptc selector for every month of the message."""
         fund_daily_link = settings.cvm_fund_url % msg.fund_pk
         self.logger.info("start scraper for %s" % fund_daily_link)
-        parse_date = msg.month_year
-        with webdriver.Chrome('chromedriver', options=self.chrome_options) as wd:
-            self.logger.debug("Success started webdriver")
-            wd.get(fund_daily_link)
-            selectors = wd.find_element(By.XPATH, '//*[@id="ddComptc"]')
-            selectors_list = selectors.text.split("\n")
-            selectors_list = [i.replace(' ', "") for i in selectors_list[:-1]]
-            selectors_filtered: Tuple = self.select_parse_date(selectors_list, parse_date)
-            # select = wd.find_element(By.XPATH, '//*[@id="ddComptc"]')
-            wd.execute_script(
-                "showDropdown = function (element) {var event; event = document.createEvent('MouseEvents'); event.initMouseEvent('mousedown', true, true, window); element.dispatchEvent(event); }; showDropdown(arguments[0]);",
-                selectors)
-            self.logger.debug(f"Starting parser for {parse_date}.")
-            parsed_ts = await self.parse_data(wd, selectors_filtered[0], selectors_filtered[1])
-        if parsed_ts is not None:
-            parsed_ts = sorted(parsed_ts)
-            self.fund_ts_model.timeseries = parsed_ts
-            self.fund_ts_model.document = msg.document
-            self.fund_ts_model.fund_pk = msg.fund_pk
-            max_ts = max(parsed_ts)
-            self.fund_ts_model.last_query_date = max_ts.timestamp
-        return self.fund_ts_model
+        async with self.driver_pool.session() as wd:
+            self.logger.debug("Checked out webdriver session")
+            selectors_list = await run_blocking(self.open_fund_page, wd, fund_daily_link)
+            for parse_date in msg.month_list():
+                try:
+                    selectors_filtered: Tuple = self.select_parse_date(selectors_list, parse_date)
+                except InvalidDateTime as e:
+                    self.logger.error(e)
+                    continue
+                self.logger.debug(f"Starting parser for {parse_date}.")
+                parsed_ts = await self.parse_data(wd, selectors_filtered[0], selectors_filtered[1])
+                yield parse_date, self.month_model(msg, parsed_ts)
 
 
 class EnhancedJSONEncoder(json.JSONEncoder):
@@ -188,21 +133,25 @@ class EnhancedJSONEncoder(json.JSONEncoder):
 class QueueConnector:
     def __init__(self):
         self.logger = logger
-        self.channel = settings.channel
+        self.stream = settings.stream
+        self.group = settings.consumer_group
+        self.consumer = settings.consumer_name
+        self.concurrency = max(settings.worker_concurrency, 1)
+        self.jobs: Set[asyncio.Task] = set()
+        # entry id -> message of the jobs in flight, kept claimed by `heartbeat`
+        self.entries: Dict[str, PubSubMsg] = {}
+        self.driver_pool = WebDriverPool()
         pool = redis.ConnectionPool.from_url(
             f"redis://{settings.redis_host}",
             decode_responses=True,
             encoding="utf-8"
         )
         self.redis = redis.Redis(connection_pool=pool)
-        self.ps = redis.from_url(
-            f"redis://{settings.redis_host}",
-            decode_responses=True,
-            encoding="utf-8"
-        )
+        self.writer = TimeSeriesWriter(self.redis, duplicate_policy="last", chunk_size=settings.madd_batch_size)
+        self.derived = DerivedSeries(self.redis, self.writer)
 
     async def add_many_to_timeseries(
-            self, key_value_pairs: Tuple, data: list[TimeSeries]
+            self, key_value_pairs: Tuple, data: list[TimeSeries], fund_pk: str = None
     ):
         """
         Add many samples to several timeseries keys.
@@ -210,106 +159,367 @@ class QueueConnector:
         timestamp key into which to insert entries and the 1th position the name
         of the key within th `data` dict to find the sample.
         """
-        partial = functools.partial(self.redis.execute_command, 'TS.MADD')
-        for entry in data:
-            for timeseries_key, attr in key_value_pairs:
-                point = entry.__getattribute__(attr)
-                v = str(point.quantize(Decimal("1.000000000"))) if isinstance(point, Decimal) else point
-                partial = functools.partial(
-                    partial,
-                    timeseries_key,
-                    int(entry.timestamp.timestamp()),
-                    v
-                )
-        return await partial()
-
-    async def create_ts(self, key):
-        try:
-            await self.redis.execute_command(
-                'TS.CREATE', key,
-                'DUPLICATE_POLICY', 'last',
-            )
-        except redis.ResponseError as e:
-            # Time series probably already exists
-            logger.info('Could not create timeseries %s, error: %s', key, e)
+        return await self.writer.write_entries(key_value_pairs, data, fund_pk)
 
     async def check_ts_by_key(self, key: str) -> bool:
         existing_key = bool(await self.redis.exists(key))
         self.logger.debug(f"Key {key} exists: {existing_key}")
         return existing_key
 
-    async def create_ts_key(self, key_list):
-        for key in key_list:
-            # existing_key = await self.check_ts_by_key(key)
-            if not bool(await self.redis.exists(key)):
-                self.logger.info(f"Key {key} not found, will be created!")
-                await self.create_ts(key)
+    async def create_ts_key(self, key_list, fund_pk: str = None):
+        await self.writer.ensure_series(key_list, fund_pk)
+
+    @staticmethod
+    def keys(doc_number: str) -> Tuple[str, str, str]:
+        return f"PRICER_value_{doc_number}", f"PRICER_owners_{doc_number}", f"PRICER_networth_{doc_number}"
+
+    @staticmethod
+    def archive_row(entry: TimeSeries) -> dict:
+        return {
+            "timestamp": int(entry.timestamp.timestamp()),
+            "value": float(entry.value),
+            "owners": int(entry.owners),
+            "net_worth": float(entry.net_worth),
+        }
+
+    async def archive_late(self, document: str, entries: List[TimeSeries]):
+        """Quotes of days already archived go to the Parquet files, Redis rejects them past the RETENTION."""
+        rows = {row["timestamp"]: row for row in map(self.archive_row, entries)}
+        await asyncio.to_thread(merge_rows, document, rows)
+        self.logger.info(f"Wrote {len(rows)} late quotes of {document} to the archive")
 
     async def stream_data(self, data: FundTS, msg: PubSubMsg):
         self.logger.debug(f"Message {msg.message_id} processed, streaming parsed data")
-        doc_number = msg.document
-        value_key = f"PRICER_value_{doc_number}"
-        owner_key = f"PRICER_owners_{doc_number}"
-        networth_key = f"PRICER_networth_{doc_number}"
-        await self.create_ts_key([value_key, owner_key, networth_key])
-        await self.add_many_to_timeseries(
-            (
-                (value_key, "value"),
-                (owner_key, "owners"),
-                (networth_key, "net_worth"),
-            ),
-            data.timeseries
-        )
+        value_key, owner_key, networth_key = self.keys(msg.document)
+        timeseries = data.timeseries
+        watermark = await self.redis.get(watermark_key(msg.document))
+        if watermark is not None:
+            late = [entry for entry in timeseries if entry.timestamp.timestamp() < int(watermark)]
+            timeseries = [entry for entry in timeseries if entry.timestamp.timestamp() >= int(watermark)]
+            if late:
+                await self.archive_late(msg.document, late)
+        if timeseries:
+            await self.create_ts_key([value_key, owner_key, networth_key], msg.fund_pk)
+            written = await self.add_many_to_timeseries(
+                (
+                    (value_key, "value"),
+                    (owner_key, "owners"),
+                    (networth_key, "net_worth"),
+                ),
+                timeseries
+            )
+            if written < 3 * len(timeseries):
+                # the month is reported failed and not marked done, it is scraped again
+                raise StreamError(f"Redis rejected {3 * len(timeseries) - written} samples of {msg.document}")
+            await self.derived.update(
+                {msg.document: [(int(entry.timestamp.timestamp()), float(entry.value)) for entry in timeseries]},
+                msg.fund_pk
+            )
+        # API replicas drop their in-process copy of the fund
+        await self.redis.publish(settings.invalidation_channel, msg.document)
+
+    @staticmethod
+    def job_key(fund_pk: str, month_year: str) -> str:
+        return f"PRICER_job_{fund_pk}_{month_year}"
+
+    @staticmethod
+    def done_key(fund_pk: str) -> str:
+        return f"PRICER_done_{fund_pk}"
+
+    @staticmethod
+    def last_business_day(month_end: date) -> date:
+        while month_end.weekday() >= 5:
+            month_end -= timedelta(days=1)
+        return month_end
+
+    def is_complete_month(self, month_year: str, data: FundTS) -> bool:
+        """A month is complete once its grid has the last business day, or DONE_GRACE_DAYS after it ended.
+
+        CVM publishes the daily reports with a lag, a month scraped right after it closes usually misses its
+        last days. The grace period covers months ending on a holiday and funds without quotes.
+        """
+        month_start = datetime.strptime(f'01/{month_year}', "%d/%m/%Y")
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        now = datetime.now()
+        if now < next_month:
+            return False
+        if now >= next_month + timedelta(days=settings.done_grace_days):
+            return True
+        last_day = self.last_business_day((next_month - timedelta(days=1)).date())
+        return bool(data.timeseries) and max(data.timeseries).timestamp.date() >= last_day
+
+    async def claim_months(self, msg: PubSubMsg) -> List[str]:
+        """Months of `msg` this worker must scrape.
+
+        Complete months are dropped, months in flight are kept only when claimed by this same message.
+        """
+        done = await self.redis.smembers(self.done_key(msg.fund_pk))
+        months = [month for month in msg.month_list() if month not in done]
+        if not months:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for month in months:
+            pipe.set(self.job_key(msg.fund_pk, month), msg.message_id, nx=True, ex=settings.job_ttl)
+            pipe.get(self.job_key(msg.fund_pk, month))
+        results = await pipe.execute()
+        owners = results[1::2]
+        return [month for month, owner in zip(months, owners) if owner == msg.message_id]
+
+    async def complete_month(self, msg: PubSubMsg, month_year: str, data: FundTS):
+        pipe = self.redis.pipeline(transaction=False)
+        if self.is_complete_month(month_year, data):
+            # complete months never change, they are not scraped again
+            pipe.sadd(self.done_key(msg.fund_pk), month_year)
+        pipe.delete(self.job_key(msg.fund_pk, month_year))
+        await pipe.execute()
+
+    async def release_months(self, msg: PubSubMsg, months):
+        if months:
+            await self.redis.delete(*[self.job_key(msg.fund_pk, month) for month in months])
+
+    @staticmethod
+    def watchers_key(fund_pk: str, month_year: str) -> str:
+        return f"PRICER_watch_{fund_pk}_{month_year}"
+
+    @staticmethod
+    def job_months_key(job_id: str) -> str:
+        return f"PRICER_scrapejob_{job_id}_months"
+
+    @staticmethod
+    def job_events_channel(job_id: str) -> str:
+        return f"PRICER_scrapejob_{job_id}_events"
+
+    async def report_months(self, msg: PubSubMsg, months: List[str], state: str):
+        """Record `state` (done | failed) of `months` on every API job waiting for them and notify its listeners."""
+        pipe = self.redis.pipeline(transaction=False)
+        for month in months:
+            pipe.smembers(self.watchers_key(msg.fund_pk, month))
+        watchers = await pipe.execute()
+        pipe = self.redis.pipeline(transaction=False)
+        for month, job_ids in zip(months, watchers):
+            for job_id in job_ids:
+                pipe.hset(self.job_months_key(job_id), month, state)
+                pipe.publish(self.job_events_channel(job_id), json.dumps({"month": month, "state": state}))
+            pipe.delete(self.watchers_key(msg.fund_pk, month))
+        await pipe.execute()
 
     async def handle_message(self, msg):
         """Kick off tasks for a given message.
         Args:
             msg (PubSubMessage): consumed message to process.
         """
+        months = await self.claim_months(msg)
+        if not months:
+            self.logger.info(f"Months of {msg.message_id} already complete or in flight, dropping it")
+            return
+        msg.months = months
+        pending = set(months)
+        failed = set()
         self.logger.debug("Creating event and start table parser.")
-        parser = DataParser()
-        data = await parser.parser_fund(msg)
-        if data:
+        if settings.scraper_engine == "http":
+            parser = HttpDataParser()
+        else:
+            parser = DataParser(self.driver_pool)
+        try:
+            async for month_year, data in parser.parse_months(msg):
+                if data.timeseries:
+                    try:
+                        # flush every month as soon as it is parsed, a crash only loses the current one
+                        await self.stream_data(data, msg)
+                    except (Exception, redis.ResponseError) as e:
+                        logger.error(
+                            'Error while streaming data series for document: %s, month: %s', msg.document, month_year
+                        )
+                        logger.info(e)
+                        await self.report_months(msg, [month_year], "failed")
+                        failed.add(month_year)
+                        continue
+                await self.complete_month(msg, month_year, data)
+                await self.report_months(msg, [month_year], "done")
+                pending.discard(month_year)
+            skipped = sorted(pending - failed)
+            if skipped:
+                # months the parser skipped, e.g. not offered on the fund page (InvalidDateTime)
+                self.logger.error(f"Months {skipped} of {msg.message_id} were not parsed")
+                await self.report_months(msg, skipped, "failed")
+        finally:
+            await self.release_months(msg, pending)
+
+        self.logger.info(
+            f"Data parsed and streamed for {msg.message_id} (job {msg.job_id}), writer at {self.writer.samples_per_second():0.0f} samples/s"
+        )
+
+    @staticmethod
+    def decode_entry(entry_id: str, fields) -> PubSubMsg:
+        fields = fields if isinstance(fields, dict) else dict(zip(fields[::2], fields[1::2]))
+        msg = PubSubMsg(**json.loads(fields["data"]))
+        msg.message_id = entry_id if msg.message_id is None else msg.message_id
+        return msg
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            self.logger.info(f"Consumer group {self.group} created on {self.stream}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def ack(self, entry_id: str, msg: PubSubMsg = None):
+        await self.redis.xack(self.stream, self.group, entry_id)
+        if msg is not None:
+            msg.acked = True
+        self.logger.info(f"Acked {entry_id}")
+
+    async def claim_stale(self, count: int) -> List[Tuple[str, PubSubMsg]]:
+        """Take over entries left pending by a consumer that crashed or restarted."""
+        response = await self.redis.execute_command(
+            "XAUTOCLAIM", self.stream, self.group, self.consumer,
+            settings.claim_idle_ms, "0-0", "COUNT", count
+        )
+        entries = response[1] if response and isinstance(response[0], str) else response
+        claimed = []
+        for entry in entries or []:
+            entry_id, fields = entry[0], entry[1]
+            if not fields:
+                # entry deleted from the stream while pending
+                await self.ack(entry_id)
+                continue
+            pending = await self.redis.xpending_range(self.stream, self.group, min=entry_id, max=entry_id, count=1)
+            if pending and pending[0]["times_delivered"] > settings.max_deliveries:
+                self.logger.error(f"Dropping {entry_id} after {pending[0]['times_delivered']} deliveries")
+                msg = self.decode_entry(entry_id, fields)
+                await self.report_months(msg, msg.month_list(), "failed")
+                await self.ack(entry_id)
+                continue
+            claimed.append((entry_id, self.decode_entry(entry_id, fields)))
+        if claimed:
+            self.logger.info(f"Claimed {len(claimed)} stale entries")
+        return claimed
+
+    async def process_entry(self, entry_id: str, msg: PubSubMsg):
+        self.logger.info(f"(Reader) Message Received: {entry_id} {msg}")
+        try:
+            await self.handle_message(msg)
+        except Exception as ex:
+            self.logger.error(f"Error while processing {entry_id}, left pending: {ex}")
+            return
+        # only acked once parsed and streamed, otherwise it stays pending to be claimed again
+        await self.ack(entry_id, msg)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.jobs)
+
+    def free_slots(self) -> int:
+        return self.concurrency - len(self.jobs)
+
+    async def wait_for_slot(self):
+        """Backpressure: nothing is read from the stream while `concurrency` jobs are running."""
+        while self.free_slots() <= 0:
+            await asyncio.wait(self.jobs, return_when=asyncio.FIRST_COMPLETED)
+
+    def job_done(self, task: asyncio.Task):
+        self.jobs.discard(task)
+        self.entries.pop(task.get_name(), None)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"Job {task.get_name()} failed: {task.exception()}")
+        self.logger.debug(f"Jobs in flight: {self.in_flight}/{self.concurrency}")
+
+    def start_job(self, entry_id: str, msg: PubSubMsg):
+        task = asyncio.create_task(self.process_entry(entry_id, msg), name=entry_id)
+        self.jobs.add(task)
+        self.entries[entry_id] = msg
+        task.add_done_callback(self.job_done)
+        self.logger.debug(f"Jobs in flight: {self.in_flight}/{self.concurrency}")
+
+    async def read_entries(self, count: int) -> List[Tuple[str, PubSubMsg]]:
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=count, block=settings.stream_block_ms
+        )
+        entries = []
+        for _, stream_entries in response or []:
+            for entry_id, fields in stream_entries:
+                entries.append((entry_id, self.decode_entry(entry_id, fields)))
+        return entries
+
+    async def heartbeat(self):
+        """Keep the entries in flight idle for less than CLAIM_IDLE_MS, however long they wait for a driver or
+        scrape, so XAUTOCLAIM on another replica never takes one that is still running.
+        XCLAIM ... JUSTID to this same consumer resets the idle time without counting a delivery,
+        the in-flight month keys get their JOB_TTL back at the same time.
+        """
+        interval = settings.claim_idle_ms / 1000 / 3
+        while True:
+            await asyncio.sleep(interval)
+            if not self.entries:
+                continue
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.execute_command("XCLAIM", self.stream, self.group, self.consumer, 0, *self.entries, "JUSTID")
+                for msg in self.entries.values():
+                    for month in msg.month_list():
+                        pipe.expire(self.job_key(msg.fund_pk, month), settings.job_ttl)
+                await pipe.execute()
+            except Exception as ex:
+                self.logger.error(f"Heartbeat of {len(self.entries)} entries in flight failed: {ex}")
+
+    @staticmethod
+    def stats_key(consumer: str) -> str:
+        return f"PRICER_worker_{consumer}"
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "concurrency": self.concurrency,
+            **{f"pool_{name}": value for name, value in self.driver_pool.stats().items()},
+        }
+
+    async def report_stats(self):
+        """Log this worker's stats and publish them on PRICER_worker_<consumer> every STATS_INTERVAL seconds,
+        the hash expires once the worker stops reporting.
+        """
+        while True:
+            stats = self.stats()
+            self.logger.info(f"Worker {self.consumer}: {stats}")
             try:
-                await self.stream_data(data, msg)
-            except (Exception, redis.ResponseError) as e:
-                logger.error(
-                    'Error while streaming data series for document: %s, month: %s', (msg.doc_number, msg.month_year)
-                )
-                logger.info(e)
-
-        # msg.acked = True -> Pure redis doesn't acked msg, only listen
-        self.logger.info(f"Data parsed and streamed. Acked {msg.message_id}")
-
-    async def reader(self, ps: redis.client.PubSub):
-        seconds = 1
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.hset(self.stats_key(self.consumer), mapping=stats)
+                pipe.expire(self.stats_key(self.consumer), settings.stats_interval * 3)
+                await pipe.execute()
+            except Exception as ex:
+                self.logger.error(f"Could not publish the stats of worker {self.consumer}: {ex}")
+            await asyncio.sleep(settings.stats_interval)
+
+    async def reader(self):
+        last_claim = 0
         while True:
             try:
-                async with async_timeout.timeout(seconds):
-                    message = await ps.get_message(ignore_subscribe_messages=True)
-                    if message is not None:
-                        self.logger.info(f"(Reader) Message Received: {message}")
-                        message_dict = json.loads(message["data"])
-                        msg = PubSubMsg(**message_dict)
-                        msg.message_id = str(uuid4()) if msg.message_id is None else msg.message_id
-                        if msg.acked:
-                            continue
-                        await asyncio.create_task(self.handle_message(msg), name=msg.message_id)
-                    await asyncio.sleep(seconds)
-            except asyncio.TimeoutError:
-                logger.info(f"No message on topic {list(ps.channels.keys())[0]} waiting for {seconds} seconds.")
-                pass
+                await self.wait_for_slot()
+                entries = []
+                if perf_counter() - last_claim > settings.claim_interval:
+                    last_claim = perf_counter()
+                    entries = await self.claim_stale(self.free_slots())
+                if not entries:
+                    entries = await self.read_entries(self.free_slots())
+                if not entries and not self.jobs:
+                    logger.info(f"No message on stream {self.stream} waiting for {settings.stream_block_ms} ms.")
+                for entry_id, msg in entries:
+                    self.start_job(entry_id, msg)
             except Exception as ex:
                 self.logger.error(ex)
+                await asyncio.sleep(1)
                 continue
 
     async def consume(self):
-        """Consumer client to subscribing to redis publisher.
+        """Consumer of the scrape jobs stream, one consumer group shared by every queue replica.
         """
-        ps = self.ps.pubsub()
-        await ps.subscribe(self.channel)
-        future = asyncio.create_task(self.reader(ps))
+        await self.ensure_group()
+        heartbeat = asyncio.create_task(self.heartbeat())
+        report = asyncio.create_task(self.report_stats())
+        future = asyncio.create_task(self.reader())
         await future
+        heartbeat.cancel()
+        report.cancel()
 
     @staticmethod
     async def shutdown(loop, signal=None):
@@ -350,6 +560,7 @@ def main():
     except KeyboardInterrupt:
         logger.info("Process interrupted")
     finally:
+        queue_connector.driver_pool.close()
         loop.close()
         logger.info("Successfully shutdown the queue service.")
 
@@ -1,4 +1,5 @@
 import logging
+import socket
 from logging.config import dictConfig
 from dotenv import find_dotenv
 from pydantic import BaseSettings, Field, BaseModel
@@ -9,9 +10,35 @@ class Settings(BaseSettings):
     cvm_fund_url: str = Field(env='FUND_DETAIL_URL', default="")
     redis_host: str = Field(env='REDIS_HOST', default="localhost")
     redis_port: int = Field(env='REDIS_PORT', default=15000)
-    channel: str = Field(env='REDIS_CHANNEL', defaul="fund_parser")
+    channel: str = Field(env='REDIS_CHANNEL', default="fund_parser")
+    stream: str = Field(env='REDIS_STREAM', default="fund_parser_stream")
+    consumer_group: str = Field(env='REDIS_CONSUMER_GROUP', default="fund_parser_workers")
+    consumer_name: str = Field(env='HOSTNAME', default_factory=socket.gethostname)
+    stream_block_ms: int = Field(env='STREAM_BLOCK_MS', default=5000)
+    claim_idle_ms: int = Field(env='CLAIM_IDLE_MS', default=600000)
+    claim_interval: int = Field(env='CLAIM_INTERVAL', default=60)
+    job_ttl: int = Field(env='JOB_TTL', default=1800)
+    done_grace_days: int = Field(env='DONE_GRACE_DAYS', default=7)
+    worker_concurrency: int = Field(env='WORKER_CONCURRENCY', default=4)
+    max_deliveries: int = Field(env='MAX_DELIVERIES', default=5)
     debug: str = Field(env='DEBUG', default="False")
     log_level: str = "DEBUG" if debug else "INFO"
+    scraper_engine: str = Field(env='SCRAPER_ENGINE', default="selenium")  # selenium | http
+    http_timeout: float = Field(env='HTTP_TIMEOUT', default=30.0)
+    driver_pool_size: int = Field(env='DRIVER_POOL_SIZE', default=2)
+    driver_max_uses: int = Field(env='DRIVER_MAX_USES', default=50)
+    browser_timeout: float = Field(env='BROWSER_TIMEOUT', default=90.0)
+    health_check_timeout: float = Field(env='HEALTH_CHECK_TIMEOUT', default=5.0)
+    stats_interval: int = Field(env='STATS_INTERVAL', default=30)
+    ingest_chunk_size: int = Field(env='INGEST_CHUNK_SIZE', default=5000)
+    madd_batch_size: int = Field(env='MADD_BATCH_SIZE', default=1000)
+    invalidation_channel: str = Field(env='REDIS_INVALIDATION_CHANNEL', default="PRICER_invalidate")
+    cdi_url: str = Field(env='CDI_URL', default="https://api.bcb.gov.br/dados/serie/bcdata.sgs.12/dados")
+    cdi_start: str = Field(env='CDI_START', default="01/01/2000")
+    archive_dir: str = Field(env='ARCHIVE_DIR', default="/archive")
+    hot_window_days: int = Field(env='HOT_WINDOW_DAYS', default=730)
+    archive_margin_days: int = Field(env='ARCHIVE_MARGIN_DAYS', default=90)
+    snapshot_batch_size: int = Field(env='SNAPSHOT_BATCH_SIZE', default=100)
 
     class Config:
         env_file = find_dotenv(filename=".env", usecwd=True)
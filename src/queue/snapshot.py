@@ -0,0 +1,222 @@
+"""Export every fund (PRICER_<doc> metadata and its value, owners and net worth series) to a Parquet snapshot,
+and load a snapshot back into an empty Redis instead of scraping everything again.
+
+    <dir>/funds.parquet   document, fund_pk, metadata (the PRICER_<doc> JSON), archived (PRICER_archived_<doc>),
+                          done_months (PRICER_done_<fund_pk>, the months never scraped again)
+    <dir>/series.parquet  document, timestamp, value, owners, net_worth, grouped by fund
+
+Funds are read SNAPSHOT_BATCH_SIZE at a time, metadata and series of a batch in one pipelined round trip, and
+written as a row group, so memory is bounded by the batch. Import streams the row groups back with pipelined
+TS.MADD and rebuilds the derived series on the way:
+
+    python snapshot.py export /snapshots/2023-01-01
+    python snapshot.py import /snapshots/2023-01-01
+"""
+import argparse
+import asyncio
+import json
+import os
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from main import QueueConnector
+from queue_settings import Settings, logger
+from ts_writer import KEY_PREFIX
+
+settings = Settings()
+
+FUNDS_FILE = "funds.parquet"
+SERIES_FILE = "series.parquet"
+FUNDS_SCHEMA = pa.schema([
+    ("document", pa.string()),
+    ("fund_pk", pa.string()),
+    ("metadata", pa.string()),
+    ("archived", pa.int64()),
+    ("done_months", pa.list_(pa.string())),
+])
+SERIES_SCHEMA = pa.schema([
+    ("document", pa.string()),
+    ("timestamp", pa.int64()),
+    ("value", pa.float64()),
+    ("owners", pa.int64()),
+    ("net_worth", pa.float64()),
+])
+
+
+def fund_key(document: str) -> str:
+    return f"{KEY_PREFIX}{document}"
+
+
+def archived_key(document: str) -> str:
+    return f"{KEY_PREFIX}archived_{document}"
+
+
+def done_key(fund_pk: str) -> str:
+    return f"{KEY_PREFIX}done_{fund_pk}"
+
+
+def fund_pk_of(metadata: str) -> Optional[str]:
+    """fund_pk label of the series, from the FundTS JSON written by the API."""
+    fund_pk = json.loads(metadata).get("fund_pk") if metadata else None
+    return str(fund_pk) if fund_pk is not None else None
+
+
+class SnapshotExporter:
+    def __init__(self, connector: QueueConnector, batch_size: int = None):
+        self.logger = logger
+        self.connector = connector
+        self.redis = connector.redis
+        self.batch_size = batch_size if batch_size is not None else settings.snapshot_batch_size
+        self.funds = 0
+        self.rows = 0
+
+    async def documents(self):
+        """Documents of the fund metadata keys, PRICER_<digits>, in batches of `batch_size`."""
+        seen, batch = set(), []
+        async for key in self.redis.scan_iter(match=f"{KEY_PREFIX}*", count=1000, _type="string"):
+            document = key[len(KEY_PREFIX):]
+            if not document.isdigit() or document in seen:
+                continue
+            seen.add(document)
+            batch.append(document)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def read_batch(self, documents: List[str]):
+        pipe = self.redis.pipeline(transaction=False)
+        for document in documents:
+            pipe.get(fund_key(document))
+            pipe.get(archived_key(document))
+            for key in self.connector.keys(document):
+                pipe.execute_command('TS.RANGE', key, '-', '+')
+        replies = await pipe.execute(raise_on_error=False)
+        funds = {name: [] for name in FUNDS_SCHEMA.names}
+        series = {name: [] for name in SERIES_SCHEMA.names}
+        for i, document in enumerate(documents):
+            metadata, archived, *samples = [
+                None if isinstance(reply, Exception) else reply for reply in replies[5 * i:5 * i + 5]
+            ]
+            funds["document"].append(document)
+            funds["fund_pk"].append(fund_pk_of(metadata))
+            funds["metadata"].append(metadata)
+            funds["archived"].append(int(archived) if archived is not None else None)
+            funds["done_months"].append(None)
+            value, owners, net_worth = ({int(ts): v for ts, v in reply or ()} for reply in samples)
+            for timestamp in sorted(value):
+                series["document"].append(document)
+                series["timestamp"].append(timestamp)
+                series["value"].append(float(value[timestamp]))
+                series["owners"].append(int(float(owners[timestamp])) if timestamp in owners else None)
+                series["net_worth"].append(float(net_worth[timestamp]) if timestamp in net_worth else None)
+        # the done sets are keyed by fund_pk, only known from the metadata
+        with_pk = [(i, fund_pk) for i, fund_pk in enumerate(funds["fund_pk"]) if fund_pk is not None]
+        pipe = self.redis.pipeline(transaction=False)
+        for _, fund_pk in with_pk:
+            pipe.smembers(done_key(fund_pk))
+        for (i, _), months in zip(with_pk, await pipe.execute() if with_pk else []):
+            funds["done_months"][i] = sorted(months)
+        return pa.table(funds, schema=FUNDS_SCHEMA), pa.table(series, schema=SERIES_SCHEMA)
+
+    async def export(self, path: str):
+        s = perf_counter()
+        os.makedirs(path, exist_ok=True)
+        with pq.ParquetWriter(os.path.join(path, FUNDS_FILE), FUNDS_SCHEMA, compression="zstd") as funds_writer, \
+                pq.ParquetWriter(os.path.join(path, SERIES_FILE), SERIES_SCHEMA, compression="zstd") as series_writer:
+            async for documents in self.documents():
+                funds, series = await self.read_batch(documents)
+                funds_writer.write_table(funds)
+                series_writer.write_table(series)
+                self.funds += funds.num_rows
+                self.rows += series.num_rows
+                self.logger.info(f"Exported {self.funds} funds, {self.rows} quotes")
+        self.logger.info(f"Exported {self.funds} funds and {self.rows} quotes to {path} in {perf_counter() - s:0.2f} s")
+
+
+class SnapshotImporter:
+    def __init__(self, connector: QueueConnector, chunk_size: int = None):
+        self.logger = logger
+        self.connector = connector
+        self.redis = connector.redis
+        self.writer = connector.writer
+        self.chunk_size = chunk_size if chunk_size is not None else settings.ingest_chunk_size
+        self.fund_pks: Dict[str, str] = {}
+        self.samples = 0
+
+    async def load_funds(self, path: str):
+        funds = pq.ParquetFile(os.path.join(path, FUNDS_FILE))
+        for batch in funds.iter_batches(batch_size=self.chunk_size):
+            pipe = self.redis.pipeline(transaction=False)
+            for fund in batch.to_pylist():
+                if fund["metadata"] is not None:
+                    pipe.set(fund_key(fund["document"]), fund["metadata"])
+                if fund["archived"] is not None:
+                    pipe.set(archived_key(fund["document"]), fund["archived"])
+                if fund["fund_pk"] is not None and fund["done_months"]:
+                    pipe.sadd(done_key(fund["fund_pk"]), *fund["done_months"])
+                self.fund_pks[fund["document"]] = fund["fund_pk"]
+            await pipe.execute()
+        self.logger.info(f"Loaded the metadata of {len(self.fund_pks)} funds")
+
+    async def write_chunk(self, rows: List[dict]):
+        series: Dict[str, list] = {}
+        quotes: Dict[str, list] = {}
+        for row in rows:
+            document, timestamp = row["document"], row["timestamp"]
+            value_key, owner_key, networth_key = self.connector.keys(document)
+            samples = series.setdefault(document, [])
+            samples.append((value_key, timestamp, row["value"]))
+            if row["owners"] is not None:
+                samples.append((owner_key, timestamp, row["owners"]))
+            if row["net_worth"] is not None:
+                samples.append((networth_key, timestamp, row["net_worth"]))
+            quotes.setdefault(document, []).append((timestamp, row["value"]))
+        # series of every fund of the row group checked and created in the same round trips
+        await self.writer.ensure_many(
+            {key: self.fund_pks.get(document) for document in series for key in self.connector.keys(document)}
+        )
+        self.samples += await self.writer.madd([sample for samples in series.values() for sample in samples])
+        await self.connector.derived.update(quotes)
+
+    async def load(self, path: str):
+        s = perf_counter()
+        await self.load_funds(path)
+        series = pq.ParquetFile(os.path.join(path, SERIES_FILE))
+        for batch in series.iter_batches(batch_size=self.chunk_size):
+            await self.write_chunk(batch.to_pylist())
+        # every fund changed, API replicas drop their whole in-process cache
+        await self.redis.publish(settings.invalidation_channel, "*")
+        elapsed = perf_counter() - s
+        self.logger.info(
+            f"Imported {self.samples} samples of {len(self.fund_pks)} funds in {elapsed:0.2f} s "
+            f"({self.samples / elapsed if elapsed else 0:0.0f} samples/s)."
+        )
+
+
+async def run(command: str, path: str, batch_size: int = None):
+    connector = QueueConnector()
+    if command == "export":
+        await SnapshotExporter(connector, batch_size).export(path)
+    else:
+        await SnapshotImporter(connector, batch_size).load(path)
+    await connector.redis.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export funds to a Parquet snapshot or import one back")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="snapshot directory")
+    parser.add_argument(
+        "--batch-size", type=int, default=None, help="funds per export batch or rows per import pipeline flush"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.command, args.path, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
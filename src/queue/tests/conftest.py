@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# the service modules are imported flat, as when run from their own directory, next to the shared ones
+# the Dockerfile copies from src/common
+service = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(service), str(service.parent / "common")]
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import httpx
+
+import http_parser
+from http_parser import HttpDataParser, hidden_fields, month_options
+from queue_models import PubSubMsg
+from table_parser import parse_daily_table
+
+FIXTURES = Path(__file__).parent / "fixtures"
+FUND_URL = "https://cvmweb.cvm.gov.br/SWB/Sistemas/SCW/CPublica/InfDiario/CPublicaInfDiario.aspx?PK_PARTIC=%s"
+CONTENT_TYPE = {"content-type": "text/html; charset=iso-8859-1"}
+
+
+def fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="latin-1")
+
+
+def test_hidden_fields():
+    fields = hidden_fields(fixture("daily_122022.html"))
+    assert fields["__EVENTTARGET"] == ""
+    assert fields["__VIEWSTATEGENERATOR"] == "0E6F1C5B"
+    assert fields["__EVENTVALIDATION"] == "/wEWBQKR2u7TCgLMmtzfDQ&12"
+    assert "+" in fields["__VIEWSTATE"]
+    assert "ddComptc" not in fields
+
+
+def test_month_options():
+    assert month_options(fixture("daily_122022.html")) == [
+        ("12/2022", "12/2022", True),
+        ("11/2022", "11/2022", False),
+        ("10/2022", "10/2022", False),
+    ]
+    assert month_options("<html></html>") == []
+
+
+def test_parse_daily_table():
+    timeseries = parse_daily_table(fixture("daily_122022.html"), "12/2022")
+    # the 06 row has no quote
+    assert [entry.timestamp for entry in timeseries] == [
+        datetime(2022, 12, 1), datetime(2022, 12, 2), datetime(2022, 12, 5), datetime(2022, 12, 7)
+    ]
+    first = timeseries[0]
+    assert first.value == Decimal("2.345678901234")
+    assert first.net_worth == 1234567890.12
+    assert first.owners == 1520
+
+
+def test_parse_daily_table_without_grid():
+    assert parse_daily_table("<html></html>", "12/2022") == []
+
+
+def test_parse_months(monkeypatch):
+    monkeypatch.setattr(http_parser.settings, "cvm_fund_url", FUND_URL)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.method == "GET":
+            return httpx.Response(200, content=(FIXTURES / "daily_122022.html").read_bytes(), headers=CONTENT_TYPE)
+        form = parse_qs(request.content.decode())
+        # the postback replays the state of the page it was made from
+        assert form["__EVENTTARGET"] == ["ddComptc"]
+        assert form["ddComptc"] == ["11/2022"]
+        assert form["__EVENTVALIDATION"] == ["/wEWBQKR2u7TCgLMmtzfDQ&12"]
+        return httpx.Response(200, content=(FIXTURES / "daily_112022.html").read_bytes(), headers=CONTENT_TYPE)
+
+    async def parse():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            msg = PubSubMsg(document="18993924000100", fund_pk="132922", months=["12/2022", "11/2022", "09/2022"])
+            return [month async for month in HttpDataParser(client).parse_months(msg)]
+
+    months = dict(asyncio.run(parse()))
+
+    # 12/2022 is already selected on the fund page, 09/2022 is not offered
+    assert list(months) == ["12/2022", "11/2022"]
+    assert [request.method for request in requests] == ["GET", "POST"]
+    assert str(requests[0].url) == FUND_URL % "132922"
+    november = months["11/2022"]
+    assert (november.document, november.fund_pk) == ("18993924000100", "132922")
+    assert len(november.timeseries) == 4
+    assert november.last_query_date == datetime(2022, 11, 30)
+    assert len(months["12/2022"].timeseries) == 4
@@ -0,0 +1,60 @@
+import asyncio
+
+from ts_writer import TimeSeriesWriter
+
+
+class RecordingPipeline:
+    def __init__(self, client: "RecordingRedis"):
+        self.client = client
+        self.commands = []
+
+    def exists(self, key: str):
+        self.commands.append(("EXISTS", key))
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+
+    async def execute(self, raise_on_error: bool = True):
+        self.client.round_trips += 1
+        self.client.commands.extend(self.commands)
+        return [0 if command[0] == "EXISTS" else "OK" for command in self.commands]
+
+
+class RecordingRedis:
+    """Every series is missing, commands are recorded by round trip."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.commands = []
+
+    def pipeline(self, transaction: bool = True) -> RecordingPipeline:
+        return RecordingPipeline(self)
+
+
+def test_ensure_many_creates_the_series_of_several_funds_in_two_round_trips():
+    client = RecordingRedis()
+    writer = TimeSeriesWriter(client)
+    keys = {
+        "PRICER_owners_18993924000100": "132922",
+        "PRICER_owners_11111111000111": "99",
+        "PRICER_owners_22222222000122": None,
+    }
+
+    asyncio.run(writer.ensure_many(keys))
+
+    assert client.round_trips == 2
+    creates = {command[1]: command for command in client.commands if command[0] == "TS.CREATE"}
+    assert set(creates) == set(keys)
+    assert creates["PRICER_owners_11111111000111"][-2:] == ("fund_pk", "99")
+    assert "fund_pk" not in creates["PRICER_owners_22222222000122"]
+    # already created, nothing sent again
+    asyncio.run(writer.ensure_many(keys))
+    assert client.round_trips == 2
+
+
+def test_created_series_are_not_shared_between_writers():
+    first, second = TimeSeriesWriter(RecordingRedis()), TimeSeriesWriter(RecordingRedis())
+    asyncio.run(first.ensure_series(["PRICER_owners_18993924000100"], "132922"))
+
+    assert "PRICER_owners_18993924000100" in first.created
+    assert not second.created